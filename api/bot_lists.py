@@ -1,19 +1,123 @@
 import aiohttp
+import asyncio
 
 
-# Post guild count to update count for bot_listing sites
-async def update_guild_counts(bot):
-    for listing in bot.config['bot_listings']:
-        async with aiohttp.ClientSession() as session:
-            url = listing['url'].format(str(bot.user.id))
-            data = {
-                listing['payload']['guild_count']: len(bot.guilds)
-            }
-            headers = listing['headers']
+# Posts the guild count of each shard to every bot listing site, using one
+# session for the lifetime of the bot. Guild count changes are coalesced, so
+# a burst of guild joins/leaves results in a single post per shard and site
+# every interval seconds. A count is only recorded as posted once every site
+# accepted it, failed posts are retried with exponential backoff
+class BotListsPublisher:
+    def __init__(self, bot, interval=60, timeout=15, max_concurrency=10,
+                 max_retry_delay=900):
+        self.bot = bot
+        self.interval = interval
+        self.max_retry_delay = max_retry_delay
+        self.timeout = timeout
+        self.session = None
+        self.post_task = None
+        self.post_semaphore = asyncio.Semaphore(max_concurrency)
+        self.posted_counts = {}
+        self.posted_total = None
 
-            # Check if api needs payload posted as data or json
-            if listing['posts_data']:
-                await session.post(url, data=data, headers=headers, timeout=15)
+        self.posts = 0
+        self.failures = 0
 
-            else:
-                await session.post(url, json=data, headers=headers, timeout=15)
+    # Post the guild counts at the end of the current interval
+    def schedule(self):
+        if self.post_task is None or self.post_task.done():
+            self.post_task = self.bot.loop.create_task(self.post_later())
+
+    async def post_later(self):
+        delay = self.interval
+        while True:
+            await asyncio.sleep(delay)
+            if await self.post():
+                return
+
+            delay = min(delay * 2, self.max_retry_delay)
+
+    # Post the guild count of every shard whose count changed since it was
+    # last posted, to all bot listing sites at once. Sites without shard
+    # support get the total guild count of the cluster, posted by the primary
+    # process only whenever the total changed. Returns whether every post
+    # succeeded
+    async def post(self):
+        shard_counts = self.bot.shard_guild_counts()
+        changed = {shard_id: guild_count for shard_id, guild_count
+                   in shard_counts.items()
+                   if self.posted_counts.get(shard_id) != guild_count}
+        total = self.bot.guild_count() if self.bot.is_primary else None
+        total_changed = total is not None and total != self.posted_total
+        if len(changed) == 0 and not total_changed:
+            return True
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+
+        # Requests keyed by the shard id they post, None for the total
+        requests = []
+        for listing in self.bot.config['bot_listings']:
+            payload = listing['payload']
+
+            if 'shard_no' not in payload or 'shard_count' not in payload:
+                if total_changed:
+                    requests.append((None, self.post_listing(listing, {
+                        payload['guild_count']: total
+                    })))
+                continue
+
+            for shard_id, guild_count in changed.items():
+                requests.append((shard_id, self.post_listing(listing, {
+                    payload['guild_count']: guild_count,
+                    payload['shard_no']: shard_id,
+                    payload['shard_count']: self.bot.shard_count
+                })))
+
+        results = await asyncio.gather(*[request for key, request in requests],
+                                       return_exceptions=True)
+
+        self.posts += len(results)
+        failed = set()
+        for (key, request), result in zip(requests, results):
+            if isinstance(result, Exception) or not 200 <= result < 300:
+                self.failures += 1
+                failed.add(key)
+
+        for shard_id, guild_count in changed.items():
+            if shard_id not in failed:
+                self.posted_counts[shard_id] = guild_count
+        if total_changed and None not in failed:
+            self.posted_total = total
+
+        return len(failed) == 0
+
+    # Post the data to a bot listing site, returns the response status
+    async def post_listing(self, listing, data):
+        url = listing['url'].format(str(self.bot.user.id))
+        headers = listing['headers']
+        timeout = aiohttp.ClientTimeout(
+            total=listing.get('timeout', self.timeout))
+
+        # Check if api needs payload posted as data or json
+        if listing['posts_data']:
+            request = self.session.post(url, data=data, headers=headers,
+                                        timeout=timeout)
+
+        else:
+            request = self.session.post(url, json=data, headers=headers,
+                                        timeout=timeout)
+
+        async with self.post_semaphore:
+            async with request as response:
+                await response.read()
+                return response.status
+
+    # Stop any scheduled post and close the session
+    async def close(self):
+        if self.post_task is not None:
+            self.post_task.cancel()
+
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
@@ -0,0 +1,160 @@
+import os
+import socket
+import sys
+import time
+from types import SimpleNamespace
+
+import asyncio
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from api.bot_lists import BotListsPublisher
+
+SHARD_COUNT = 64
+MAX_CONCURRENCY = 4
+INTERVAL = 0.2
+
+# How long the stub sites take to answer each post
+RESPONSE_TIME = 0.02
+
+
+# A bot listing site with shard support and one without it, counting the
+# requests they get and every connection they were sent over. The next
+# `failures` posts get a 500
+class StubSites:
+    def __init__(self):
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections = set()
+        self.failures = 0
+        self.sharded = {}
+        self.total = None
+
+    async def handle(self, request):
+        self.requests += 1
+        self.connections.add(request.transport.get_extra_info('peername'))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(RESPONSE_TIME)
+            if self.failures > 0:
+                self.failures -= 1
+                return web.Response(status=500)
+
+            if request.match_info['site'] == 'sharded':
+                data = await request.json()
+                self.sharded[data['shard_id']] = data['server_count']
+            else:
+                data = await request.post()
+                self.total = int(data['server_count'])
+            return web.Response(status=200)
+
+        finally:
+            self.in_flight -= 1
+
+    def reset(self):
+        self.requests = 0
+        self.max_in_flight = 0
+
+
+# Stands in for the bot, with one guild count per shard
+class FakeBot:
+    def __init__(self, port):
+        self.loop = asyncio.get_event_loop()
+        self.user = SimpleNamespace(id=221609683562135553)
+        self.is_primary = True
+        self.shard_count = SHARD_COUNT
+        self.counts = {shard_id: 1000 for shard_id in range(SHARD_COUNT)}
+        url = 'http://127.0.0.1:{}/{}/{{}}/stats'
+        self.config = {'bot_listings': [
+            {'url': url.format(port, 'sharded'), 'headers': {},
+             'payload': {'guild_count': 'server_count',
+                         'shard_count': 'shard_count',
+                         'shard_no': 'shard_id'},
+             'posts_data': False},
+            {'url': url.format(port, 'total'), 'headers': {},
+             'payload': {'guild_count': 'server_count'},
+             'posts_data': True}
+        ]}
+
+    def shard_guild_counts(self):
+        return dict(self.counts)
+
+    def guild_count(self):
+        return sum(self.counts.values())
+
+
+# Wait for the scheduled post, and any retries, to finish
+async def wait_for_post(publisher):
+    start = time.monotonic()
+    await publisher.post_task
+    return time.monotonic() - start
+
+
+async def run():
+    sites = StubSites()
+    app = web.Application()
+    app.router.add_post('/{site}/{bot_id}/stats', sites.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    await web.SockSite(runner, sock).start()
+
+    bot = FakeBot(sock.getsockname()[1])
+    publisher = BotListsPublisher(bot, interval=INTERVAL,
+                                  max_concurrency=MAX_CONCURRENCY)
+
+    def report(name, elapsed):
+        print('{:<34} {:>3} requests {} max in flight {} connections so far '
+              '{:.2f}s'.format(name, sites.requests, sites.max_in_flight,
+                               len(sites.connections), elapsed))
+        sites.reset()
+
+    try:
+        # A burst of guild joins is coalesced into one post per shard and
+        # site, at most MAX_CONCURRENCY at a time
+        for i in range(1000):
+            bot.counts[i % SHARD_COUNT] += 1
+            publisher.schedule()
+        report('1,000 joins, every shard changed',
+               await wait_for_post(publisher))
+        assert sites.sharded == bot.counts
+        assert sites.total == bot.guild_count()
+        session = publisher.session
+
+        # Only shards whose count changed are posted again, over the same
+        # session and its kept alive connections
+        bot.counts[3] += 1
+        publisher.schedule()
+        report('1 join', await wait_for_post(publisher))
+        assert publisher.session is session
+
+        publisher.schedule()
+        report('No change', await wait_for_post(publisher))
+
+        # Failed posts are retried with backoff until every site accepts
+        # them, only the failed shards are posted again
+        for shard_id in range(8):
+            bot.counts[shard_id] += 1
+        sites.failures = 5
+        publisher.schedule()
+        report('8 changed, 5 posts fail', await wait_for_post(publisher))
+        assert sites.sharded == bot.counts
+        assert sites.total == bot.guild_count()
+
+        print('{} posts, {} failed'.format(publisher.posts,
+                                           publisher.failures))
+
+    finally:
+        await publisher.close()
+        await runner.cleanup()
+
+
+# Posts guild counts for a fake bot to stub bot listing sites on localhost,
+# checking posts are coalesced, concurrency limited, sent over one session
+# and retried until they succeed
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(run())
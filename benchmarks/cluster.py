@@ -0,0 +1,175 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+import asyncio
+import asyncpg
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import prefixes
+from broker import PostgresBroker
+from command_stats import CommandStats
+from vote_reminders import VoteReminders
+
+Guild = namedtuple('Guild', 'id')
+
+# Subscriber used by the vote reminder check, removed again afterwards
+USER_ID = 900000000000000001
+
+
+# Stands in for one bot.py process of a cluster, with a fake gateway: its
+# guilds are given rather than received from Discord. It shares prefixes,
+# guild counts, command stats and vote reminders over its own broker
+# connection, wired up the same way FlandersBOT wires them
+class FakeProcess:
+    def __init__(self, cluster_id, db, db_credentials, guild_count, data_dir):
+        self.cluster_id = cluster_id
+        self.loop = asyncio.get_event_loop()
+        self.db = db
+        self.guilds = list(range(guild_count))
+        self.remote_guild_counts = {}
+        self.prefixes = prefixes.PrefixRegistry([])
+
+        self.broker = PostgresBroker(cluster_id, db_credentials,
+                                     channel='cluster_test',
+                                     reconnect_delay=0.5, health_interval=5)
+        self.broker.subscribe('prefix', self.on_remote_prefix)
+        self.broker.subscribe('guild_count', self.on_remote_guild_count)
+        self.broker.on_resync(self.resync)
+        self.command_stats = CommandStats(
+            self.loop, broker=self.broker, flush_interval=3600,
+            file_path=os.path.join(data_dir,
+                                   'command_stats_{}.json'.format(cluster_id)))
+        self.reminders = VoteReminders(self, self.broker)
+
+    async def start(self):
+        self.broker.start()
+        self.command_stats.start()
+        await self.reminders.start(send_reminders=False)
+
+    async def close(self):
+        await self.command_stats.close()
+        await self.broker.close()
+
+    async def set_prefix(self, guild_id, prefix):
+        self.prefixes.update(guild_id, prefix)
+        await self.broker.publish('prefix', {'guild_id': guild_id,
+                                             'prefix': prefix})
+
+    def on_remote_prefix(self, origin, data):
+        self.prefixes.update(data['guild_id'], data['prefix'])
+
+    def on_remote_guild_count(self, origin, guild_count):
+        self.remote_guild_counts[origin] = guild_count
+
+    async def resync(self):
+        await self.broker.publish('guild_count', len(self.guilds))
+
+    def guild_count(self):
+        return len(self.guilds) + sum(self.remote_guild_counts.values())
+
+
+# Wait until the check passes for every process, returns the seconds waited
+async def wait_for_all(processes, check, timeout=10):
+    start = time.monotonic()
+    while not all(check(process) for process in processes):
+        if time.monotonic() - start > timeout:
+            raise AssertionError('Timed out')
+        await asyncio.sleep(0.01)
+
+    return time.monotonic() - start
+
+
+async def run(db_credentials, process_count):
+    db = await asyncpg.create_pool(**db_credentials)
+    await db.execute('DELETE FROM vote_reminders WHERE user_id = $1;', USER_ID)
+    data_dir = tempfile.mkdtemp()
+    processes = [FakeProcess(cluster_id, db, db_credentials,
+                             (cluster_id + 1) * 100, data_dir)
+                 for cluster_id in range(process_count)]
+    total = sum(len(process.guilds) for process in processes)
+    first, last = processes[0], processes[-1]
+
+    async def check(name, coro):
+        try:
+            print('{:<44} {:.3f}s'.format(name, await coro))
+        except AssertionError as e:
+            print('{:<44} FAILED ({})'.format(name, e))
+
+    try:
+        for process in processes:
+            await process.start()
+
+        # Every process asks for a resync when it connects, so every process
+        # learns every other process's guild count
+        await check('Connect and share guild counts', wait_for_all(
+            processes, lambda p: p.guild_count() == total))
+
+        await first.set_prefix(1, '!')
+        await check('Prefix reaches every process', wait_for_all(
+            processes, lambda p: p.prefixes.custom_prefix(Guild(1)) == '!'))
+
+        for process in processes:
+            process.command_stats.increment('simpsons')
+            await process.command_stats.publish()
+        await check('Command stats total across processes', wait_for_all(
+            processes, lambda p: p.command_stats.total() == process_count))
+
+        await last.reminders.subscribe(USER_ID)
+        await check('Reminder subscription reaches every process',
+                    wait_for_all(processes, lambda p: USER_ID in p.reminders))
+
+        # Kill the last process's broker connection, counts published while
+        # it's down are lost to it and made up for by the resync it asks for
+        # once it reconnects
+        pid = last.broker.listener.connection.get_server_pid()
+        await db.execute('SELECT pg_terminate_backend($1);', pid)
+        await wait_for_all([last], lambda p: not p.broker.listener.connected
+                           .is_set())
+        first.command_stats.increment('futurama')
+        await first.command_stats.publish()
+        await check('Lost event made up for after reconnecting', wait_for_all(
+            processes, lambda p: p.command_stats.total() == process_count + 1))
+
+        # A burst of publishes from every process at once
+        start = time.monotonic()
+        await asyncio.gather(*[process.broker.publish('guild_count', total)
+                               for process in processes for i in range(50)])
+        print('{:<44} {:.3f}s'.format(
+            '{} concurrent publishes'.format(50 * process_count),
+            time.monotonic() - start))
+
+        for process in processes:
+            print('Cluster {}: {} published, {} received, {} failed, '
+                  '{} reconnects'.format(
+                      process.cluster_id, process.broker.published,
+                      process.broker.received, process.broker.failures,
+                      process.broker.listener.reconnects))
+
+    finally:
+        await last.reminders.unsubscribe(USER_ID)
+        for process in processes:
+            await process.close()
+        await db.close()
+
+
+# Runs a cluster of fake processes in one event loop against a local
+# Postgres with bot.sql loaded, e.g. a throwaway database:
+# createdb flanders_bench
+# psql -d flanders_bench -f bot.sql
+# python3 benchmarks/cluster.py --dsn postgresql:///flanders_bench
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Check cluster state sharing over a local Postgres')
+    parser.add_argument('--dsn', required=True,
+                        help='connection string of the database to use')
+    parser.add_argument('--processes', type=int, default=3,
+                        help='number of fake processes to run')
+    args = parser.parse_args()
+
+    asyncio.get_event_loop().run_until_complete(
+        run({'dsn': args.dsn}, args.processes))
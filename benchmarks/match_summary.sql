@@ -0,0 +1,78 @@
+-- Compares the three aggregate queries end_match ran for a match scoreboard
+-- with the single grouped match summary query, over 2,000,000 seeded answers,
+-- with and without the indexes on answers.round_id and rounds.match_id. Run
+-- against a throwaway database:
+-- createdb flanders_bench
+-- psql -d flanders_bench -f benchmarks/match_summary.sql
+\set ON_ERROR_STOP on
+SET client_min_messages = warning;
+\ir ../bot.sql
+
+-- 20,000 matches of 10 rounds, 10 answers per round from 100,000 users
+INSERT INTO matches (match_id, guild_id, trivia_category, is_complete)
+SELECT m, 1, 'simpsons', true FROM generate_series(1, 20000) m;
+
+INSERT INTO rounds (round_id, match_id, question_index, is_complete)
+SELECT r, (r - 1) / 10 + 1, r % 300, true FROM generate_series(1, 200000) r;
+
+INSERT INTO answers (round_id, user_id, username, is_correct, answer_index,
+                     answer_time)
+SELECT a / 10 + 1, (a * 7919::bigint) % 100000 + 1, 'user', a % 3 != 0, a % 3,
+       1000 + (a * 37) % 15000
+FROM generate_series(0, 1999999) a;
+
+ANALYZE;
+
+\timing on
+
+\echo 'Indexed, three queries run by the old end_match'
+SELECT user_id, COUNT(CASE WHEN is_correct THEN 1 END) AS correct
+FROM answers a
+INNER JOIN rounds r
+ON a.round_id = r.round_id
+WHERE r.match_id = 10000
+GROUP BY a.user_id
+ORDER BY correct DESC;
+
+SELECT user_id,
+       CAST(COUNT(CASE WHEN is_correct THEN 1 END) AS FLOAT) /
+       CAST(COUNT(user_id) AS FLOAT) AS accuracy
+FROM answers a
+INNER JOIN rounds r
+ON a.round_id = r.round_id
+WHERE r.match_id = 10000
+GROUP BY a.user_id
+ORDER BY accuracy DESC;
+
+SELECT user_id, MIN(answer_time) AS fastest_time
+FROM answers a
+INNER JOIN rounds r
+ON a.round_id = r.round_id
+WHERE a.is_correct = true and r.match_id = 10000
+GROUP BY a.user_id
+ORDER BY fastest_time ASC;
+
+\echo 'Indexed, single match summary query'
+SELECT a.user_id, MIN(a.username) AS name, COUNT(*) AS answered,
+       COUNT(CASE WHEN a.is_correct THEN 1 END) AS correct,
+       MIN(a.answer_time) AS fastest_time,
+       MIN(CASE WHEN a.is_correct THEN a.answer_time END) AS fastest_correct
+FROM answers a
+INNER JOIN rounds r
+ON a.round_id = r.round_id
+WHERE r.match_id = 10000
+GROUP BY a.user_id;
+
+DROP INDEX answers_round_id_idx;
+DROP INDEX rounds_match_id_idx;
+
+\echo 'Unindexed, single match summary query'
+SELECT a.user_id, MIN(a.username) AS name, COUNT(*) AS answered,
+       COUNT(CASE WHEN a.is_correct THEN 1 END) AS correct,
+       MIN(a.answer_time) AS fastest_time,
+       MIN(CASE WHEN a.is_correct THEN a.answer_time END) AS fastest_correct
+FROM answers a
+INNER JOIN rounds r
+ON a.round_id = r.round_id
+WHERE r.match_id = 10000
+GROUP BY a.user_id;
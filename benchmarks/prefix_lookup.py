@@ -0,0 +1,50 @@
+import os
+import sys
+import timeit
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import prefixes
+
+Guild = namedtuple('Guild', 'id')
+
+LOOKUPS = 10000
+GUILD_COUNTS = [1000, 10000, 100000]
+
+
+# The list scan get_prefix used before the registry, kept for comparison
+def scan_prefixes_for(guild, prefix_data):
+    for entry in prefix_data:
+        if entry['guildID'] == guild.id:
+            return list(prefixes.DEFAULT_PREFIXES) + [entry['prefix']]
+
+    return list(prefixes.DEFAULT_PREFIXES)
+
+
+# Time per-message prefix resolution using the list scan and the registry,
+# looking up guilds spread evenly through the prefix list
+def benchmark(guild_count):
+    prefix_data = [{'guildID': guild_id, 'prefix': '!'}
+                   for guild_id in range(guild_count)]
+    registry = prefixes.PrefixRegistry(prefix_data)
+    guilds = [Guild(guild_id) for guild_id in
+              range(0, guild_count, max(1, guild_count // LOOKUPS))]
+
+    # Sample fewer guilds for the scan, a full run takes minutes
+    scan_guilds = guilds[::max(1, guild_count // 1000)]
+    scan_time = timeit.timeit(
+        lambda: [scan_prefixes_for(guild, prefix_data)
+                 for guild in scan_guilds], number=1) / len(scan_guilds)
+    registry_time = timeit.timeit(
+        lambda: [registry.prefixes_for(guild) for guild in guilds],
+        number=1) / len(guilds)
+
+    print('{:>7} guilds | scan: {:>10.2f}us | registry: {:>6.3f}us | '
+          '{:>8.0f}x'.format(guild_count, scan_time * 1e6,
+                             registry_time * 1e6, scan_time / registry_time))
+
+
+if __name__ == '__main__':
+    for count in GUILD_COUNTS:
+        benchmark(count)
@@ -0,0 +1,137 @@
+-- Compares the queries the per-answer update_stats trigger ran with the
+-- set-based score_round and score_match functions, over 2,000,000 seeded
+-- answers and 1,000,000 seeded votes. Run against a throwaway database:
+-- createdb flanders_bench
+-- psql -d flanders_bench -f benchmarks/scoring.sql
+\set ON_ERROR_STOP on
+SET client_min_messages = warning;
+\ir ../bot.sql
+
+-- The per-row scoring functions the old triggers used
+
+-- Get the user_id of user that won match,
+-- Winner is determined based on correct answers, then fastest answer if tie
+CREATE OR REPLACE FUNCTION get_winner(p_match_id bigint)
+RETURNS bigint AS $$
+    BEGIN
+        RETURN (
+            SELECT user_id FROM (
+                SELECT * FROM answers a
+                INNER JOIN rounds r
+                ON a.round_id = r.round_id
+                WHERE r.match_id = p_match_id
+            ) match_answers
+            GROUP by user_id
+            ORDER BY COUNT(CASE WHEN is_correct THEN 1 END) DESC, MIN(answer_time) ASC
+            LIMIT 1
+            );
+    END;
+$$ LANGUAGE plpgsql;
+
+-- Get the user_id of the user that had the fastest correct answer in the match
+CREATE OR REPLACE FUNCTION get_fastest_answer(p_match_id bigint)
+RETURNS bigint AS $$
+    BEGIN
+        RETURN (
+            SELECT user_id FROM answers a
+            INNER JOIN rounds r
+            ON a.round_id = r.round_id
+            WHERE a.is_correct = true and r.match_id = p_match_id
+            GROUP BY a.user_id
+            ORDER BY MIN(answer_time) ASC
+            LIMIT 1
+        );
+    END;
+$$ LANGUAGE plpgsql;
+
+-- Check if answer is a new unique answer
+CREATE OR REPLACE FUNCTION is_unique_answer(p_user_id bigint, p_question_index int) 
+RETURNS boolean AS $$
+	BEGIN
+		RETURN (
+		 	SELECT COUNT(a.user_id) FROM answers a
+		 	INNER JOIN rounds r
+		 	ON a.round_id = r.round_id 
+		 	WHERE r.question_index = p_question_index AND 
+		 		a.is_correct = true AND a.user_id = p_user_id
+		) = 0;
+	END;
+$$ LANGUAGE plpgsql;
+
+-- Adds the vote xp multiplier to points gained, rounds to nearest 5
+CREATE OR REPLACE FUNCTION vote_multiply(p_user_id bigint, points bigint)
+RETURNS bigint as $$
+	DECLARE
+		vote_multiplier float := (CASE WHEN has_voted_today(p_user_id) THEN 1.5 ELSE 1 END);
+	BEGIN
+		RETURN multiply_points(vote_multiplier, points);
+	END;
+$$ LANGUAGE plpgsql;
+
+-- 20,000 matches of 10 rounds, 10 answers per round from 100,000 users
+INSERT INTO matches (match_id, guild_id, trivia_category, is_complete)
+SELECT m, 1, 'simpsons', true FROM generate_series(1, 20000) m;
+
+INSERT INTO rounds (round_id, match_id, question_index, is_complete)
+SELECT r, (r - 1) / 10 + 1, r % 300, true FROM generate_series(1, 200000) r;
+
+INSERT INTO answers (round_id, user_id, username, is_correct, answer_index,
+                     answer_time)
+SELECT a / 10 + 1, (a * 7919::bigint) % 100000 + 1, 'user', a % 3 != 0, a % 3,
+       1000 + (a * 37) % 15000
+FROM generate_series(0, 1999999) a;
+
+-- Votes spread over the last 90 days
+INSERT INTO vote_history (user_id, vote_type, is_weekend, voted_at)
+SELECT v % 100000 + 1, 'upvote', false,
+       (NOW() AT time zone 'utc') - (v % 129600) * INTERVAL '1 MINUTE'
+FROM generate_series(0, 999999) v;
+
+INSERT INTO correct_answers (user_id, question_index)
+SELECT DISTINCT a.user_id, r.question_index FROM answers a
+INNER JOIN rounds r
+ON a.round_id = r.round_id
+WHERE a.is_correct
+ON CONFLICT DO NOTHING;
+
+INSERT INTO leaderboard (user_id, username)
+SELECT u, 'user' FROM generate_series(1, 100000) u;
+
+-- The match being scored, 5 rounds with 20 players answering each round
+INSERT INTO matches (match_id, guild_id, trivia_category)
+VALUES (20001, 1, 'simpsons');
+
+INSERT INTO rounds (round_id, match_id, question_index)
+SELECT r, 20001, r % 300 FROM generate_series(200001, 200005) r;
+
+INSERT INTO answers (round_id, user_id, username, is_correct, answer_index,
+                     answer_time)
+SELECT r, u, 'user', (r + u) % 2 = 0, (r + u) % 3, 1000 + u * 500
+FROM generate_series(200001, 200005) r, generate_series(1, 20) u;
+
+ANALYZE;
+
+\timing on
+
+\echo 'Round, per-answer queries run by the update_stats trigger'
+SELECT SUM(CASE WHEN is_unique_answer(a.user_id, r.question_index)
+           THEN vote_multiply(a.user_id, 500) ELSE 0 END
+           + vote_multiply(a.user_id, 100))
+FROM answers a
+INNER JOIN rounds r
+ON a.round_id = r.round_id
+WHERE a.round_id = 200001;
+
+\echo 'Round, set-based score_round'
+BEGIN;
+SELECT score_round(200001);
+ROLLBACK;
+
+\echo 'Match, per-row queries run by the old end_match trigger'
+SELECT get_winner(20001), get_fastest_answer(20001),
+       vote_multiply(get_winner(20001), 1000);
+
+\echo 'Match, set-based score_match'
+BEGIN;
+SELECT score_match(20001);
+ROLLBACK;
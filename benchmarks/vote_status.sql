@@ -0,0 +1,94 @@
+-- Compares the COUNT over vote_history that has_voted_today used to run
+-- with an EXISTS over vote_history and the EXISTS over latest_votes it runs
+-- now, over 5,000,000 seeded votes. Run against a throwaway database:
+-- createdb flanders_bench
+-- psql -d flanders_bench -f benchmarks/vote_status.sql
+\set ON_ERROR_STOP on
+SET client_min_messages = warning;
+\ir ../bot.sql
+
+-- Votes from 200,000 users spread over the last year, latest_votes is
+-- filled the same way migrations/005_latest_votes.sql fills it
+ALTER TABLE vote_history DISABLE TRIGGER update_latest_vote;
+
+INSERT INTO vote_history (user_id, vote_type, is_weekend, voted_at)
+SELECT v % 200000 + 1, 'upvote', false,
+       (NOW() AT time zone 'utc') - (v % 525600) * INTERVAL '1 MINUTE'
+FROM generate_series(0, 4999999) v;
+
+ALTER TABLE vote_history ENABLE TRIGGER update_latest_vote;
+
+INSERT INTO latest_votes (user_id, vote_type, voted_at)
+SELECT user_id, vote_type, MAX(voted_at) FROM vote_history
+GROUP BY user_id, vote_type;
+
+VACUUM ANALYZE;
+
+-- The old has_voted_today
+CREATE FUNCTION count_voted_today(p_user_id bigint) RETURNS boolean AS $$
+	BEGIN
+		RETURN (
+			SELECT COUNT(v.voted_at) FROM vote_history v
+			WHERE v.user_id = p_user_id
+			AND v.voted_at BETWEEN (
+				NOW() AT time zone 'utc') - INTERVAL '24 HOURS' AND (
+				NOW() AT time zone 'utc')
+		) != 0;
+	END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION exists_voted_today(p_user_id bigint) RETURNS boolean AS $$
+	SELECT EXISTS (
+		SELECT 1 FROM vote_history v
+		WHERE v.user_id = p_user_id
+		AND v.voted_at > (NOW() AT time zone 'utc') - INTERVAL '24 HOURS'
+	);
+$$ LANGUAGE sql STABLE;
+
+\timing on
+
+\echo '10 checks, COUNT over vote_history without indexes'
+BEGIN;
+DROP INDEX vote_history_user_id_voted_at_idx;
+DROP INDEX vote_history_voted_at_idx;
+SELECT COUNT(*) FILTER (WHERE count_voted_today(u))
+FROM generate_series(1, 200000, 20000) u;
+ROLLBACK;
+
+\echo '10,000 checks, COUNT over vote_history'
+SELECT COUNT(*) FILTER (WHERE count_voted_today(u))
+FROM generate_series(1, 200000, 20) u;
+
+\echo '10,000 checks, EXISTS over vote_history'
+SELECT COUNT(*) FILTER (WHERE exists_voted_today(u))
+FROM generate_series(1, 200000, 20) u;
+
+\echo '10,000 checks, EXISTS over latest_votes (has_voted_today)'
+SELECT COUNT(*) FILTER (WHERE has_voted_today(u))
+FROM generate_series(1, 200000, 20) u;
+
+\echo 'Latest upvote of one user, MAX over vote_history'
+SELECT MAX(voted_at) FROM vote_history
+WHERE user_id = 4242 AND vote_type = 'upvote';
+
+\echo 'Latest upvote of one user, latest_votes'
+SELECT voted_at FROM latest_votes
+WHERE user_id = 4242 AND vote_type = 'upvote';
+
+\echo '10,000 new votes, kept in latest_votes by the update_latest_vote trigger'
+BEGIN;
+INSERT INTO vote_history (user_id, vote_type, is_weekend)
+SELECT v, 'upvote', false FROM generate_series(1, 10000) v;
+ROLLBACK;
+
+\echo '10,000 new votes without the trigger'
+BEGIN;
+ALTER TABLE vote_history DISABLE TRIGGER update_latest_vote;
+INSERT INTO vote_history (user_id, vote_type, is_weekend)
+SELECT v, 'upvote', false FROM generate_series(1, 10000) v;
+ROLLBACK;
+
+\timing off
+
+DROP FUNCTION count_voted_today(bigint);
+DROP FUNCTION exists_voted_today(bigint);
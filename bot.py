@@ -1,3 +1,4 @@
+import argparse
 import json
 from datetime import datetime
 import sys
@@ -10,12 +11,21 @@ from discord.ext import commands
 
 import api.bot_lists
 import prefixes
+from broker import LocalBroker
+from broker import PostgresBroker
+from command_stats import CommandStats
+from gif_cache import GifCache
+from member_counter import MemberCounter
+from presence import PresenceScheduler
+from screencap_store import ScreencapStore
+from vote_listener import VoteListener
+from vote_reminders import VoteReminders
 
 
 # Get the prefixes for the bot
 def get_prefix(bot, message):
-    extras = prefixes.prefixes_for(message.guild, bot.prefix_data)
-    return commands.when_mentioned_or(*extras)(bot, message)
+    extras = bot.prefixes.prefixes_for(message.guild)
+    return commands.when_mentioned(bot, message) + list(extras)
 
 
 # All cogs that will be loaded on bots startup
@@ -25,27 +35,80 @@ startup_extensions = [
     ]
 
 
-class FlandersBOT(commands.Bot):
-    def __init__(self):
-        super().__init__(command_prefix=get_prefix, case_insensitive=True)
+# Parse shard ids given as ranges and/or single ids e.g. 0-3,8,10-11
+def parse_shard_ids(value):
+    shard_ids = []
+    for part in value.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            shard_ids.extend(range(int(first), int(last) + 1))
+
+        else:
+            shard_ids.append(int(part))
+
+    return shard_ids
+
+
+# Shards are launched automatically unless the shard count (and optionally
+# the shard ids this process runs) are given, e.g. to split shards across
+# multiple processes. Processes started by launcher.py also get a cluster id,
+# and share prefixes, reminders and stats with the rest of the cluster
+class FlandersBOT(commands.AutoShardedBot):
+    def __init__(self, shard_count=None, shard_ids=None, cluster_id=None):
+        super().__init__(command_prefix=get_prefix, case_insensitive=True,
+                         shard_count=shard_count, shard_ids=shard_ids)
 
         self.remove_command('help')
-        self.command_stats = self.read_command_stats()
-        self.status_index = 0
-        self.bg_task = self.loop.create_task(self.cycle_status_format())
-        self.db_conn = None
-        self.bg_task_2 = self.loop.create_task(self.track_votes())
+
+        with open('settings/config.json', 'r') as config_file:
+            self.config = json.load(config_file)
+
+        self.cluster_id = cluster_id
+        self.broker = self.create_broker()
+        self.broker.subscribe('prefix', self.on_remote_prefix)
+        self.broker.subscribe('guild_count', self.on_remote_guild_count)
+        self.broker.subscribe('shutdown', self.on_remote_shutdown)
+        self.broker.on_resync(self.resync)
+        self.remote_guild_counts = {}
+
+        # Guild joins and leaves within guild_count_delay seconds of each
+        # other are shared with the cluster as one event
+        self.guild_count_delay = self.config.get('cluster', {}).get(
+            'guild_count_delay', 10)
+        self.guild_count_task = None
+        self.broker.start()
+
+        # Each process in a cluster keeps its own command stats file
+        command_stats_config = dict(self.config.get('command_stats', {}))
+        if not self.is_primary:
+            file_path = command_stats_config.get(
+                'file_path', 'cogs/data/command_stats.json')
+            command_stats_config['file_path'] = file_path.replace(
+                '.json', '_{}.json'.format(cluster_id))
+
+        self.command_stats = CommandStats(self.loop, broker=self.broker,
+                                          **command_stats_config)
+        self.command_stats.start()
+        self.presence = PresenceScheduler(self,
+                                          **self.config.get('presence', {}))
+        self.presence.start()
+        self.vote_listener = VoteListener(
+            self, self.on_vote, **self.config.get('vote_listener', {}))
         self.status_formats = ['Ned help | {} Servers', 'Ned vote | {} Servers']
-        self.prefix_data = prefixes.read_prefixes()
+        self.prefixes = prefixes.PrefixRegistry(prefixes.read_prefixes())
         self.uptime = datetime.utcnow()
         self.LOGGING_CHANNEL = 415700137302818836
-        self.cached_screencaps = {}
-        self.reminders = []
+        self.cached_screencaps = ScreencapStore(
+            **self.config.get('screencap_store', {}))
+        self.gif_cache = GifCache(self.loop, **self.config.get('gif_cache', {}))
+        self.bot_lists = api.bot_lists.BotListsPublisher(
+            self, **self.config.get('bot_lists', {}))
+        self.reminders = VoteReminders(self, self.broker)
+        self.member_counts = MemberCounter(
+            self, **self.config.get('member_counter', {}))
+        self.member_counts.start()
         self.db = None
 
-        with open('settings/config.json', 'r') as config_file:
-            self.config = json.load(config_file)
-
         for extension in startup_extensions:
             try:
                 self.load_extension(extension)
@@ -57,37 +120,35 @@ class FlandersBOT(commands.Bot):
     async def on_ready(self):
         print('Username: ' + str(self.user.name))
         print('Client ID: ' + str(self.user.id))
-        await self.update_status()
+        self.update_status()
         if not hasattr(self, 'uptime'):
             self.uptime = datetime.utcnow()
 
         if self.db is None:
             self.db = await asyncpg.create_pool(**self.config['db_credentials'])
+            await self.reminders.start(send_reminders=self.is_primary)
+
+            # Only one process in a cluster thanks and reminds voters
+            if self.is_primary:
+                self.vote_listener.start()
 
     # Update guild count on join
     async def on_guild_join(self, guild):
-        await self.update_status()
+        self.update_status()
 
     # Update guild count on leave
     async def on_guild_remove(self, guild):
-        await self.update_status()
+        self.update_status()
 
     # Prevent bot from replying to other bots
     async def on_message(self, message):
         if not message.author.bot:
-            ctx = await bot.get_context(message)
+            ctx = await self.get_context(message)
             await self.invoke(ctx)
 
     # Track number of command executed
     async def on_command(self, ctx):
-        command = ctx.command.qualified_name
-        if command in self.command_stats:
-            self.command_stats[command] += 1
-
-        else:
-            self.command_stats[command] = 1
-
-        self.write_command_stats(self.command_stats)
+        self.command_stats.increment(ctx.command.qualified_name)
 
     # Commands error handler
     async def on_command_error(self, ctx, error):
@@ -133,83 +194,149 @@ class FlandersBOT(commands.Bot):
             traceback.print_exception(type(error), error, error.__traceback__,
                                       file=sys.stderr)
 
+    # Whether this process runs alone or is the first process of a cluster
+    @property
+    def is_primary(self):
+        return self.cluster_id is None or self.cluster_id == 0
+
+    # Share state with the other processes of the cluster over Postgres, a
+    # single process has nothing to share it with. The local broker only
+    # reaches brokers in the same process, so it can't run a cluster
+    def create_broker(self):
+        if self.cluster_id is None:
+            return LocalBroker()
+
+        cluster = self.config.get('cluster', {})
+        if cluster.get('broker', 'postgres') != 'postgres':
+            raise ValueError('Clusters need the postgres broker, got {!r}'
+                             .format(cluster['broker']))
+
+        return PostgresBroker(self.cluster_id, self.config['db_credentials'],
+                              cluster.get('channel', 'cluster'))
+
+    # Set a guild's custom prefix in every process of the cluster
+    async def set_prefix(self, guild_id, prefix):
+        self.prefixes.update(guild_id, prefix)
+        self.prefixes.save()
+        await self.broker.publish('prefix', {'guild_id': guild_id,
+                                             'prefix': prefix})
+
+    # Another process changed a guild's prefix and has saved it to file
+    def on_remote_prefix(self, origin, data):
+        self.prefixes.update(data['guild_id'], data['prefix'])
+
+    # Another process's guild count changed, its guilds are in the status and
+    # the cluster total posted to bot listing sites
+    def on_remote_guild_count(self, origin, guild_count):
+        self.remote_guild_counts[origin] = guild_count
+        self.presence.request_update()
+        self.bot_lists.schedule()
+
+    # Events from the other processes may have been lost, reload the prefixes
+    # they saved to file and send this process's guild count again
+    async def resync(self):
+        prefix_data = await self.loop.run_in_executor(None,
+                                                      prefixes.read_prefixes)
+        self.prefixes = prefixes.PrefixRegistry(prefix_data)
+        await self.broker.publish('guild_count', len(self.guilds))
+
+    def on_remote_shutdown(self, origin, data):
+        self.loop.create_task(self.shutdown(publish=False))
+
+    # Number of guilds across every process of the cluster
+    def guild_count(self):
+        return len(self.guilds) + sum(self.remote_guild_counts.values())
+
+    # Write any pending data and close every connection, shutting the rest of
+    # the cluster down too unless the shutdown came from another process
+    async def shutdown(self, publish=True):
+        if publish:
+            await self.broker.publish('shutdown', None)
+
+        self.reminders.stop()
+        await self.vote_listener.close()
+        await self.command_stats.close()
+        await self.gif_cache.close()
+        await self.bot_lists.close()
+        await self.broker.close()
+
+        # Usernames still being synced need the pool
+        trivia = self.get_cog('Trivia')
+        if trivia is not None:
+            await trivia.username_sync.flush()
+
+        if self.db is not None:
+            await self.db.close()
+        await self.logout()
+        await self.close()
+
+    # Count the guilds on each shard run by this process
+    def shard_guild_counts(self):
+        shard_counts = {shard_id: 0 for shard_id in self.shards}
+        for guild in self.guilds:
+            shard_counts[guild.shard_id] = (
+                shard_counts.get(guild.shard_id, 0) + 1)
+
+        return shard_counts
+
     # Update guild count at bot listing sites and in bots status/presence
-    async def update_status(self):
-        await api.bot_lists.update_guild_counts(self)
-        status = discord.Game(name=self.status_formats[self.status_index].
-                              format(len(self.guilds)))
-        await self.change_presence(activity=status)
-
-    # Cycle through all status formats, waits a minute between status changes
-    async def cycle_status_format(self):
-        await self.wait_until_ready()
-        while not self.is_closed():
-            if self.status_index >= len(self.status_formats) - 1:
-                self.status_index = 0
-
-            else:
-                self.status_index += 1
-
-            status = discord.Game(name=self.status_formats[self.status_index].
-                                  format(len(self.guilds)))
-
-            await self.change_presence(activity=status)
-            await asyncio.sleep(60)
-
-    async def track_votes(self):
-        self.db_conn = await asyncpg.connect(**self.config['db_credentials'])
-
-        async def vote_listener(*args):
-            # Get user_id from payload
-            user_id = int(args[0][-1])
+    def update_status(self):
+        self.bot_lists.schedule()
+        self.presence.request_update()
+        self.schedule_guild_count()
+
+    # Share the guild count with the cluster at the end of the current delay
+    def schedule_guild_count(self):
+        if self.guild_count_task is None or self.guild_count_task.done():
+            self.guild_count_task = self.loop.create_task(
+                self.publish_guild_count())
+
+    async def publish_guild_count(self):
+        await asyncio.sleep(self.guild_count_delay)
+        await self.broker.publish('guild_count', len(self.guilds))
+
+    # Remind a subscribed user when they can vote again, thanking them too if
+    # the vote was just made
+    async def on_vote(self, user_id, voted_at, thank):
+        if user_id not in self.reminders:
+            return
+
+        await self.reminders.schedule(user_id, voted_at)
+        if not thank:
+            return
+
+        try:
             user = self.get_user(user_id)
 
-            # Thank subscribed user for voting
-            if user_id in self.reminders:
-                await user.send('Thanks for voting! You will now be notified '
-                                'when you can vote again in 12 hours.')
-
-            # Get timestamp of users latest vote
-            query = '''SELECT MAX(votedAt) FROM VoteHistory
-                       WHERE userID = $1 AND voteType = 'upvote';'''
-            row = await self.db_conn.fetchrow(query, user_id)
+            # Users only in guilds of other processes aren't cached here
+            if user is None:
+                user = await self.fetch_user(user_id)
 
-            # Calculate seconds until next vote
-            time_diff = (datetime.utcnow() - row['max'])
-            seconds_remaining = 43200 - time_diff.seconds
+            await user.send('Thanks for voting! You will now be notified '
+                            'when you can vote again in 12 hours.')
 
-            # Wait time remaining (should be 12 hours)
-            await asyncio.sleep(seconds_remaining)
-
-            # Notify subscribed user that they are able to vote again.
-            if user_id in self.reminders:
-                await user.send('<https://discordbots.org/bot/2216096835621'
-                                '35553/vote>\n**You can vote now.**')
-
-        # Add listener to db connection for when user votes
-        await self.db_conn.add_listener('vote', lambda *args: self.loop.
-                                        create_task(vote_listener(args)))
-
-    # Read the command statistics from json file
-    @staticmethod
-    def read_command_stats():
-        with open('cogs/data/command_stats.json', 'r') as command_counter:
-            command_stats = json.load(command_counter)
-            command_counter.close()
-
-        return command_stats
+        except discord.HTTPException:
+            pass
 
-    # Dump the command statistics to json file
-    @staticmethod
-    def write_command_stats(command_stats):
-        with open('cogs/data/command_stats.json', 'w') as command_counter:
-            json.dump(command_stats, command_counter, indent=4)
-            command_counter.close()
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run FlandersBOT')
+    parser.add_argument('--shard-count', type=int,
+                        help='total number of shards across all processes')
+    parser.add_argument('--shards', type=parse_shard_ids,
+                        help='shard ids run by this process, e.g. 0-3')
+    parser.add_argument('--cluster-id', type=int,
+                        help='id of this process when started by launcher.py')
+    args = parser.parse_args()
 
-bot = FlandersBOT()
+    with open('settings/config.json', 'r') as conf:
+        config = json.load(conf)
 
-with open('settings/config.json', 'r') as conf:
-    config = json.load(conf)
+    # Command line arguments override the sharding config
+    sharding = config.get('sharding', {})
+    shard_count = args.shard_count or sharding.get('shard_count')
+    shard_ids = args.shards or sharding.get('shard_ids')
 
-bot.run(config['bot_token'])
+    bot = FlandersBOT(shard_count=shard_count, shard_ids=shard_ids,
+                      cluster_id=args.cluster_id)
+    bot.run(config['bot_token'])
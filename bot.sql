@@ -7,6 +7,22 @@ CREATE TABLE IF NOT EXISTS vote_history (
 	voted_at timestamp DEFAULT (NOW() at time zone 'utc') NOT NULL
 );
 
+-- Latest vote of each user for each vote type, kept up to date by the
+-- insert_vote trigger so vote checks never scan vote_history
+CREATE TABLE IF NOT EXISTS latest_votes (
+	user_id bigint NOT NULL,
+	vote_type text NOT NULL,
+	voted_at timestamp NOT NULL,
+	PRIMARY KEY (user_id, vote_type)
+);
+
+-- Users subscribed to vote reminders and when their next reminder is due,
+-- remind_at is null when no reminder is pending
+CREATE TABLE IF NOT EXISTS vote_reminders (
+	user_id bigint PRIMARY KEY,
+	remind_at timestamp
+);
+
 -- Every trivia match (multiple questions)
 CREATE TABLE IF NOT EXISTS matches (
 	match_id serial PRIMARY KEY,
@@ -48,68 +64,48 @@ CREATE TABLE IF NOT EXISTS leaderboard (
 	longest_streak int DEFAULT 0 NOT NULL
 );
 
--- Check if user has voted in the last 24 hours
-CREATE OR REPLACE FUNCTION has_voted_today(p_user_id bigint) 
-RETURNS boolean AS $$
-	BEGIN
-		RETURN (
-			SELECT COUNT(v.voted_at) FROM vote_history v 
-			WHERE v.user_id = p_user_id
-			AND v.voted_at BETWEEN (
-				NOW() AT time zone 'utc') - INTERVAL '24 HOURS' AND (
-				NOW() AT time zone 'utc')
-		) != 0;
-	END;
-$$ LANGUAGE plpgsql;
-
--- Get the user_id of user that won match,
--- Winner is determined based on correct answers, then fastest answer if tie
-CREATE OR REPLACE FUNCTION get_winner(p_match_id bigint)
-RETURNS bigint AS $$
-    BEGIN
-        RETURN (
-            SELECT user_id FROM (
-                SELECT * FROM answers a
-                INNER JOIN rounds r
-                ON a.round_id = r.round_id
-                WHERE r.match_id = p_match_id
-            ) match_answers
-            GROUP by user_id
-            ORDER BY COUNT(CASE WHEN is_correct THEN 1 END) DESC, MIN(answer_time) ASC
-            LIMIT 1
-            );
-    END;
-$$ LANGUAGE plpgsql;
+-- Every question a user has answered correctly at least once, used for
+-- finding unique answers without scanning the answers table
+CREATE TABLE IF NOT EXISTS correct_answers (
+	user_id bigint NOT NULL,
+	question_index int NOT NULL,
+	PRIMARY KEY (user_id, question_index)
+);
 
--- Get the user_id of the user that had the fastest correct answer in the match
-CREATE OR REPLACE FUNCTION get_fastest_answer(p_match_id bigint)
-RETURNS bigint AS $$
-    BEGIN
-        RETURN (
-            SELECT user_id FROM answers a
-            INNER JOIN rounds r
-            ON a.round_id = r.round_id
-            WHERE a.is_correct = true and r.match_id = p_match_id
-            GROUP BY a.user_id
-            ORDER BY MIN(answer_time) ASC
-            LIMIT 1
-        );
-    END;
-$$ LANGUAGE plpgsql;
+-- Find the answers of a round and the rounds of a match without a
+-- sequential scan
+CREATE INDEX IF NOT EXISTS answers_round_id_idx ON answers (round_id);
+CREATE INDEX IF NOT EXISTS rounds_match_id_idx ON rounds (match_id);
+
+-- Find the recent votes of the users being scored
+CREATE INDEX IF NOT EXISTS vote_history_user_id_voted_at_idx
+ON vote_history (user_id, voted_at);
+
+-- Find the votes added since the vote listener last caught up
+CREATE INDEX IF NOT EXISTS vote_history_voted_at_idx
+ON vote_history (voted_at);
+
+-- Read the top players of each leaderboard stat straight from an index
+CREATE INDEX IF NOT EXISTS leaderboard_score_idx
+ON leaderboard (score DESC) INCLUDE (username);
+CREATE INDEX IF NOT EXISTS leaderboard_wins_idx
+ON leaderboard (wins DESC) INCLUDE (username);
+CREATE INDEX IF NOT EXISTS leaderboard_correct_answers_idx
+ON leaderboard (correct_answers DESC) INCLUDE (username);
+CREATE INDEX IF NOT EXISTS leaderboard_fastest_answer_idx
+ON leaderboard (fastest_answer ASC) INCLUDE (username);
+CREATE INDEX IF NOT EXISTS leaderboard_longest_streak_idx
+ON leaderboard (longest_streak DESC) INCLUDE (username);
 
--- Check if answer is a new unique answer
-CREATE OR REPLACE FUNCTION is_unique_answer(p_user_id bigint, p_question_index int) 
+-- Check if user has voted in the last 24 hours
+CREATE OR REPLACE FUNCTION has_voted_today(p_user_id bigint) 
 RETURNS boolean AS $$
-	BEGIN
-		RETURN (
-		 	SELECT COUNT(a.user_id) FROM answers a
-		 	INNER JOIN rounds r
-		 	ON a.round_id = r.round_id 
-		 	WHERE r.question_index = p_question_index AND 
-		 		a.is_correct = true AND a.user_id = p_user_id
-		) = 0;
-	END;
-$$ LANGUAGE plpgsql;
+	SELECT EXISTS (
+		SELECT 1 FROM latest_votes v
+		WHERE v.user_id = p_user_id
+		AND v.voted_at > (NOW() AT time zone 'utc') - INTERVAL '24 HOURS'
+	);
+$$ LANGUAGE sql STABLE;
 
 -- Calculates the level using a users score
 CREATE OR REPLACE FUNCTION calculate_level(score bigint) 
@@ -141,152 +137,197 @@ RETURNS int AS $$
 	END;
 $$ LANGUAGE plpgsql;
 
--- Adds the vote xp multiplier to points gained, rounds to nearest 5
-CREATE OR REPLACE FUNCTION vote_multiply(p_user_id bigint, points bigint)
-RETURNS bigint as $$
-	DECLARE
-		vote_multiplier float := (CASE WHEN has_voted_today(p_user_id) THEN 1.5 ELSE 1 END);
-		new_points int;
+-- Applies a vote xp multiplier to points gained, rounds to nearest 5
+CREATE OR REPLACE FUNCTION multiply_points(multiplier float, points bigint)
+RETURNS bigint AS $$
+	SELECT CAST(5 * ROUND(multiplier * points / 5) AS bigint);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Update the statistics of every user that answered in a round, in a single
+-- pass over the round's answers. Users can only answer once per round.
+-- Correct: 100 points, 10 bonus points for each correct answer in a row and
+-- 500 bonus points the first time the user answers the question correctly
+-- Incorrect: 5 points and reset the streak
+-- Round bonus: 50 points for the fastest correct answer and 50 points for
+-- being the only correct answer
+CREATE OR REPLACE FUNCTION score_round(p_round_id int) RETURNS void AS $$
 	BEGIN
-		SELECT 5 * ROUND(vote_multiplier * points / 5) INTO new_points;
-		RETURN new_points;
+		-- Insert users that answered into leaderboard
+		INSERT INTO leaderboard (user_id, username)
+		SELECT DISTINCT ON (user_id) user_id, username
+		FROM answers WHERE round_id = p_round_id
+		ON CONFLICT DO NOTHING;
+
+		WITH round_answers AS (
+			SELECT a.user_id, a.is_correct, a.answer_time, r.question_index
+			FROM answers a
+			INNER JOIN rounds r
+			ON a.round_id = r.round_id
+			WHERE a.round_id = p_round_id
+		),
+		-- Users that answered and have the vote multiplier today
+		voters AS (
+			SELECT DISTINCT v.user_id FROM latest_votes v
+			WHERE v.user_id IN (SELECT user_id FROM round_answers)
+			AND v.voted_at > (NOW() AT time zone 'utc') - INTERVAL '24 HOURS'
+		),
+		-- Correct answers to a question the user never answered correctly
+		unique_answers AS (
+			INSERT INTO correct_answers (user_id, question_index)
+			SELECT user_id, question_index FROM round_answers
+			WHERE is_correct
+			ON CONFLICT DO NOTHING
+			RETURNING user_id
+		),
+		fastest_answer AS (
+			SELECT user_id FROM round_answers
+			WHERE is_correct
+			ORDER BY answer_time ASC
+			LIMIT 1
+		),
+		correct_count AS (
+			SELECT COUNT(*) AS total FROM round_answers WHERE is_correct
+		),
+		deltas AS (
+			SELECT ra.user_id, ra.is_correct, ra.answer_time,
+				(CASE WHEN vo.user_id IS NULL THEN 1 ELSE 1.5 END) AS multiplier,
+				ua.user_id IS NOT NULL AS is_unique,
+				fa.user_id IS NOT NULL AS is_fastest,
+				ra.is_correct AND cc.total = 1 AS is_only
+			FROM round_answers ra
+			CROSS JOIN correct_count cc
+			LEFT JOIN voters vo ON ra.user_id = vo.user_id
+			LEFT JOIN unique_answers ua ON ra.user_id = ua.user_id
+			LEFT JOIN fastest_answer fa ON ra.user_id = fa.user_id
+		)
+		UPDATE leaderboard l SET
+			score = l.score
+				+ multiply_points(d.multiplier, CASE WHEN d.is_correct
+					THEN 100 + (10 * l.current_streak) ELSE 5 END)
+				+ (CASE WHEN d.is_unique THEN multiply_points(d.multiplier, 500) ELSE 0 END)
+				+ (CASE WHEN d.is_fastest THEN multiply_points(d.multiplier, 50) ELSE 0 END)
+				+ (CASE WHEN d.is_only THEN multiply_points(d.multiplier, 50) ELSE 0 END),
+			correct_answers = l.correct_answers + (CASE WHEN d.is_correct THEN 1 ELSE 0 END),
+			incorrect_answers = l.incorrect_answers + (CASE WHEN d.is_correct THEN 0 ELSE 1 END),
+			fastest_answer = (CASE WHEN d.is_correct
+				THEN LEAST(l.fastest_answer, d.answer_time) ELSE l.fastest_answer END),
+			current_streak = (CASE WHEN d.is_correct THEN l.current_streak + 1 ELSE 0 END),
+			longest_streak = (CASE WHEN d.is_correct
+				THEN GREATEST(l.longest_streak, l.current_streak + 1) ELSE l.longest_streak END)
+		FROM deltas d
+		WHERE l.user_id = d.user_id;
 	END;
 $$ LANGUAGE plpgsql;
 
--- Update a users statistics when a user answers
-CREATE OR REPLACE FUNCTION update_stats() RETURNS TRIGGER AS $BODY$
-	DECLARE 
-		question int := (SELECT question_index 
-			             FROM rounds 
-			             WHERE round_id = new.round_id);
+-- Update the statistics of every player in a match, in a single pass over the
+-- match's answers. Requires that 5 rounds were played, with more than one
+-- player. Winner is determined based on correct answers, then fastest answer
+-- 1,000 bonus points and +1 win for the winner, 100 bonus points and +1 loss
+-- for every other player, 100 bonus points for the fastest correct answer
+CREATE OR REPLACE FUNCTION score_match(p_match_id int) RETURNS void AS $$
+	DECLARE
+		round_count int := (SELECT COUNT(*) FROM rounds
+						    WHERE match_id = p_match_id);
 	BEGIN
-		-- Insert user that answers into leaderboard
-		INSERT INTO leaderboard (user_id, username) 
-		VALUES (new.user_id, new.username) ON CONFLICT DO NOTHING;
-
-		-- Update stats for correct answer (100 points for correct, increase streak)
-		IF new.is_correct THEN
-
-			-- 500 Bonus points for correctly answering  a unique answer
-			IF (SELECT is_unique_answer(new.user_id, question)) THEN
-				UPDATE leaderboard SET score = score + (SELECT vote_multiply(user_id, 500))
-				WHERE user_id = new.user_id;
-			END IF;
+		IF round_count < 5 THEN
+			RETURN;
+		END IF;
 
-			-- 100 points for correct answer, 10 bonus points multiplier for each correct in a row
-		    UPDATE leaderboard SET score = score + (SELECT vote_multiply(user_id, 100 + (10 * current_streak))), 
-		        correct_answers = correct_answers + 1,
-		        -- New fastest answer
-		        fastest_answer = LEAST(fastest_answer, new.answer_time), 
-		        -- Update consecutive answer streaks
-		        current_streak = current_streak + 1, 
-		        longest_streak = GREATEST(longest_streak, current_streak + 1)
-		    WHERE user_id = new.user_id;
+		WITH players AS (
+			SELECT a.user_id,
+				COUNT(CASE WHEN a.is_correct THEN 1 END) AS correct,
+				MIN(a.answer_time) AS fastest_time,
+				MIN(CASE WHEN a.is_correct THEN a.answer_time END) AS fastest_correct
+			FROM answers a
+			INNER JOIN rounds r
+			ON a.round_id = r.round_id
+			WHERE r.match_id = p_match_id
+			GROUP BY a.user_id
+		),
+		ranked AS (
+			SELECT user_id, COUNT(*) OVER () AS player_count,
+				ROW_NUMBER() OVER (ORDER BY correct DESC, fastest_time ASC) AS placing,
+				ROW_NUMBER() OVER (ORDER BY fastest_correct ASC NULLS LAST) AS speed,
+				fastest_correct
+			FROM players
+		),
+		voters AS (
+			SELECT DISTINCT v.user_id FROM latest_votes v
+			WHERE v.user_id IN (SELECT user_id FROM players)
+			AND v.voted_at > (NOW() AT time zone 'utc') - INTERVAL '24 HOURS'
+		),
+		deltas AS (
+			SELECT rk.user_id, rk.placing = 1 AS is_winner,
+				rk.speed = 1 AND rk.fastest_correct IS NOT NULL AS is_fastest,
+				(CASE WHEN vo.user_id IS NULL THEN 1 ELSE 1.5 END) AS multiplier
+			FROM ranked rk
+			LEFT JOIN voters vo ON rk.user_id = vo.user_id
+			WHERE rk.player_count > 1
+		)
+		UPDATE leaderboard l SET
+			wins = l.wins + (CASE WHEN d.is_winner THEN 1 ELSE 0 END),
+			losses = l.losses + (CASE WHEN d.is_winner THEN 0 ELSE 1 END),
+			score = l.score
+				+ multiply_points(d.multiplier, CASE WHEN d.is_winner THEN 1000 ELSE 100 END)
+				+ (CASE WHEN d.is_fastest THEN multiply_points(d.multiplier, 100) ELSE 0 END)
+		FROM deltas d
+		WHERE l.user_id = d.user_id;
+	END;
+$$ LANGUAGE plpgsql;
 
-		-- Update stats for incorrect answer (5 points, reset streak)
-		ELSE
-	        UPDATE leaderboard SET score = score + (SELECT vote_multiply(user_id, 5)), 
-	        incorrect_answers = incorrect_answers + 1, 
-	        current_streak = 0
-	        WHERE user_id = new.user_id;
+-- Record each vote as the user's latest vote of its type
+CREATE OR REPLACE FUNCTION insert_vote() RETURNS TRIGGER AS $BODY$
+	BEGIN
+		IF (new.user_id IS NOT NULL AND new.vote_type IS NOT NULL) THEN
+			INSERT INTO latest_votes (user_id, vote_type, voted_at)
+			VALUES (new.user_id, new.vote_type, new.voted_at)
+			ON CONFLICT (user_id, vote_type) DO UPDATE
+			SET voted_at = GREATEST(latest_votes.voted_at, EXCLUDED.voted_at);
 		END IF;
 		RETURN NEW;
 	END;
 $BODY$
 language plpgsql;
 
--- Add bonus points for being the fastest and only correct answer
+-- Update stats of all users that answered once the round is complete
 CREATE OR REPLACE FUNCTION end_round() RETURNS TRIGGER AS $BODY$
-	DECLARE
-		-- Get user_id of user that answered correctly fastest
-		fastest_user bigint := (SELECT user_id FROM answers a
-								WHERE a.round_id = new.round_id AND a.is_correct = true
-								GROUP BY a.user_id
-								ORDER BY MIN(answer_time) ASC
-								LIMIT 1);
-
-		-- Get number of correct answers for round
-		correct_count int := (SELECT COUNT(CASE WHEN is_correct THEN 1 END) FROM answers a
-						  WHERE a.round_id = new.round_id AND a.is_correct = true);
-
-		-- Get user_id of top answer (only used if correct_count is 1)
-		only_answer bigint := (SELECT user_id FROM answers a
-							   WHERE a.round_id = new.round_id AND a.is_correct = true
-							   LIMIT 1);
 	BEGIN
-		-- 50 Bonus points for fastest answer in round
-		UPDATE leaderboard SET score = score + vote_multiply(user_id, 50)
-		WHERE user_id = fastest_user;
-
-		-- 50 Bonus points for being only correct answer
-		IF (correct_count = 1) THEN
-			UPDATE leaderboard SET score = score + vote_multiply(user_id, 50)
-			WHERE user_id = only_answer;
+		IF (new.is_complete AND NOT old.is_complete) THEN
+			PERFORM score_round(new.round_id);
 		END IF;
 		RETURN NEW;
 	END;
 $BODY$
 language plpgsql;
 
--- Add bonus points for being winner, loser, and being fastest answer,
--- requires that 5 rounds were played, with more than one player
+-- Update stats of all players once the match is complete
 CREATE OR REPLACE FUNCTION end_match() RETURNS TRIGGER AS $BODY$
-	DECLARE
-		-- Get number of rounds
-		round_count int := (SELECT COUNT(DISTINCT round_id) AS round_count
-						    FROM rounds 
-						    WHERE match_id = new.match_id);
-
-		-- Get number of players that participated
-		player_count int := (SELECT COUNT(DISTINCT user_id) FROM answers a 
-			             INNER JOIN rounds r
-			             ON a.round_id = r.round_id
-			             WHERE r.match_id = new.match_id);
-
-		-- Get user_id of winner of match
-	    winner bigint := (SELECT get_winner(new.match_id));
-
-	    -- Get user_id of fastest answer in match
-	    fastest_user bigint := (SELECT get_fastest_answer(new.match_id));
 	BEGIN
-		-- Check that it counts as a valid multiplayer match 
-		-- (more than 1 player, at least 5 rounds)
-		IF (round_count >= 5 AND player_count > 1) THEN
-
-			-- 1,000 Bonus Points for winning, +1 Win
-		    UPDATE leaderboard SET wins = wins + 1,
-		    score = score + (SELECT vote_multiply(user_id, 1000))
-		    WHERE user_id = winner;
-
-		    -- 100 Bonus Points for losing, +1 Loss, 
-		    UPDATE leaderboard SET losses = losses + 1,
-		    score = score + (SELECT vote_multiply(user_id, 100))
-		    WHERE user_id != winner;
-
-		    -- 100 Bonus points for being fastest correct answer in match
-		    UPDATE leaderboard SET score = score + (SELECT vote_multiply(user_id, 100))
-		    WHERE user_id = fastest_user;
+		IF (new.is_complete AND NOT old.is_complete) THEN
+			PERFORM score_match(new.match_id);
 		END IF;
 		RETURN NEW;
 	END;
 $BODY$
 language plpgsql;
 
--- Trigger stats update on inserted answer
-CREATE TRIGGER insert_answer
-	BEFORE INSERT ON answers
+-- Keep latest_votes up to date on every vote
+DROP TRIGGER IF EXISTS update_latest_vote ON vote_history;
+CREATE TRIGGER update_latest_vote
+	AFTER INSERT ON vote_history
 	FOR EACH ROW
-	EXECUTE FUNCTION update_stats();
+	EXECUTE FUNCTION insert_vote();
 
 -- Trigger stat updates on round end
+DROP TRIGGER IF EXISTS update_round ON rounds;
 CREATE TRIGGER update_round
 	BEFORE UPDATE ON rounds
 	FOR EACH ROW
 	EXECUTE FUNCTION end_round();
 
 -- Trigger stat updates on match end
+DROP TRIGGER IF EXISTS update_match ON matches;
 CREATE TRIGGER update_match
 	BEFORE UPDATE ON matches
 	FOR EACH ROW
 	EXECUTE FUNCTION end_match();
-
@@ -0,0 +1,153 @@
+import abc
+import json
+
+import asyncio
+
+from pg_listener import CONNECTION_ERRORS
+from pg_listener import PostgresListener
+
+# Sent by a process that may have missed events, every process sends its
+# state again when it receives it
+RESYNC = 'resync'
+
+
+# Shares events between the processes of a cluster. Every event published
+# is delivered to the subscribers of every other process in the cluster, but
+# not to the process that published it
+class Broker(abc.ABC):
+    def __init__(self, cluster_id):
+        self.cluster_id = cluster_id
+        self.subscribers = {}
+        self.resync_callbacks = []
+        self.published = 0
+        self.received = 0
+
+    # Call callback(origin, data) for every event of the type from another
+    # process, origin is the cluster id of the process that published it
+    def subscribe(self, event, callback):
+        self.subscribers.setdefault(event, []).append(callback)
+
+    # Call callback() whenever events may have been lost, so the process can
+    # reload shared state and send its own state again
+    def on_resync(self, callback):
+        self.resync_callbacks.append(callback)
+
+    def start(self):
+        pass
+
+    @abc.abstractmethod
+    async def publish(self, event, data):
+        pass
+
+    async def close(self):
+        pass
+
+    # Pass an event on to its subscribers
+    def dispatch(self, origin, event, data):
+        if origin == self.cluster_id:
+            return
+
+        self.received += 1
+        if event == RESYNC:
+            self.resync()
+            return
+
+        for callback in self.subscribers.get(event, []):
+            self.call(callback, origin, data)
+
+    def resync(self):
+        for callback in self.resync_callbacks:
+            self.call(callback)
+
+    @staticmethod
+    def call(callback, *args):
+        result = callback(*args)
+        if asyncio.iscoroutine(result):
+            asyncio.ensure_future(result)
+
+
+# Delivers events between brokers in the same process, used when running a
+# single process and for testing clusters against a fake gateway
+class LocalBroker(Broker):
+    def __init__(self, cluster_id=0, brokers=None):
+        super().__init__(cluster_id)
+
+        # All brokers sharing the list receive each others events
+        self.brokers = brokers if brokers is not None else []
+        self.brokers.append(self)
+
+    async def publish(self, event, data):
+        self.published += 1
+        for broker in self.brokers:
+            broker.dispatch(self.cluster_id, event, json.loads(
+                json.dumps(data)))
+
+
+# Delivers events between processes using Postgres LISTEN/NOTIFY, the same
+# way votes are delivered by the dbl webhook, over a listener connection kept
+# open the same way the vote listener's is. Every time it connects, and after
+# a publish fails, the cluster is asked to resync so any event lost in the
+# meantime is made up for
+class PostgresBroker(Broker):
+    def __init__(self, cluster_id, db_credentials, channel='cluster',
+                 reconnect_delay=1, max_reconnect_delay=60, health_interval=30,
+                 publish_timeout=10):
+        super().__init__(cluster_id)
+        self.publish_timeout = publish_timeout
+        self.listener = PostgresListener(
+            'Cluster broker', db_credentials, channel, self.on_notify,
+            on_connect=self.on_connect, on_health_check=self.send_resync,
+            reconnect_delay=reconnect_delay,
+            max_reconnect_delay=max_reconnect_delay,
+            health_interval=health_interval, query_timeout=publish_timeout)
+        self.resync_pending = False
+        self.failures = 0
+
+    def start(self):
+        self.listener.start()
+
+    # Events may have been missed while disconnected
+    async def on_connect(self):
+        self.resync_pending = True
+        await self.send_resync()
+
+    # Resync if an event may have been lost since the last resync
+    async def send_resync(self):
+        if self.resync_pending:
+            self.resync_pending = False
+            self.resync()
+            await asyncio.wait_for(self.send(RESYNC, None),
+                                   timeout=self.publish_timeout)
+
+    def on_notify(self, connection, pid, channel, payload):
+        message = json.loads(payload)
+        self.dispatch(message['origin'], message['event'], message['data'])
+
+    # Notify payloads are limited to 8000 bytes, events should stay small.
+    # Events published while disconnected are sent once reconnected, unless
+    # that takes longer than publish_timeout. A lost event is made up for by
+    # the resync once the connection works again
+    async def publish(self, event, data):
+        try:
+            await asyncio.wait_for(self.listener.connected.wait(),
+                                   timeout=self.publish_timeout)
+            await asyncio.wait_for(self.send(event, data),
+                                   timeout=self.publish_timeout)
+            self.published += 1
+
+        except CONNECTION_ERRORS as e:
+            self.failures += 1
+            self.resync_pending = True
+            print('Failed to publish {} event: {!r}'.format(event, e))
+
+    async def send(self, event, data):
+        payload = json.dumps({
+            'origin': self.cluster_id,
+            'event': event,
+            'data': data
+        })
+        await self.listener.execute('SELECT pg_notify($1, $2)',
+                                    self.listener.channel, payload)
+
+    async def close(self):
+        await self.listener.close()
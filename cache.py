@@ -0,0 +1,130 @@
+import time
+from collections import OrderedDict
+
+import asyncio
+
+
+# A size bounded cache that evicts the least recently used entry when full.
+# Entries expire `ttl` seconds after they were set, or after they were last
+# used if refresh_on_get is set. A ttl can also be given per entry
+class LRUCache:
+    def __init__(self, max_size=1000, ttl=None, refresh_on_get=False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.refresh_on_get = refresh_on_get
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    # Get the value of a key, None if it is missing or has expired
+    def get(self, key, count=True):
+        entry = self.entries.get(key)
+        if entry is None:
+            if count:
+                self.misses += 1
+            return None
+
+        value, ttl, expires_at = entry
+        now = time.monotonic()
+        if expires_at is not None and now >= expires_at:
+            del self.entries[key]
+            self.expirations += 1
+            if count:
+                self.misses += 1
+            return None
+
+        if self.refresh_on_get and ttl is not None:
+            self.entries[key] = (value, ttl, now + ttl)
+
+        self.entries.move_to_end(key)
+        if count:
+            self.hits += 1
+        return value
+
+    # Set the value of a key, evicting the least recently used entries if the
+    # cache is full
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self.entries[key] = (value, ttl, expires_at)
+        self.entries.move_to_end(key)
+
+        # Entries are kept in order of use, so with a shared ttl any expired
+        # entries are at the front
+        now = time.monotonic()
+        while len(self.entries) > 0:
+            oldest_key = next(iter(self.entries))
+            expires_at = self.entries[oldest_key][2]
+            if expires_at is None or now < expires_at:
+                break
+
+            del self.entries[oldest_key]
+            self.expirations += 1
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        return entry[0] if entry is not None else None
+
+    # Remove every expired entry, entries are otherwise only removed when
+    # they are looked up or evicted
+    def remove_expired(self):
+        now = time.monotonic()
+        expired = [key for key, (value, ttl, expires_at) in
+                   self.entries.items()
+                   if expires_at is not None and now >= expires_at]
+        for key in expired:
+            del self.entries[key]
+
+        self.expirations += len(expired)
+        return len(expired)
+
+    # Hit, miss and eviction counters
+    def metrics(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups > 0 else None,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+# Coalesces concurrent calls for the same key, so only the first caller runs
+# the coroutine and every other caller awaits its result
+class SingleFlight:
+    def __init__(self):
+        self.in_flight = {}
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self.in_flight)
+
+    # Run coro_func() for the key, or wait on the call already running for it
+    async def run(self, key, coro_func):
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(coro_func())
+        self.in_flight[key] = future
+        future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        return await asyncio.shield(future)
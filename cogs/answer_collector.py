@@ -0,0 +1,46 @@
+# Records the answers given during a single trivia round in memory, so they
+# can be written to the DB in one batch once the round's timer has ended
+class AnswerCollector:
+    def __init__(self, round_id):
+        self.round_id = round_id
+        self.answers = {}
+        self.correct_names = []
+
+    def __len__(self):
+        return len(self.answers)
+
+    def __contains__(self, user_id):
+        return user_id in self.answers
+
+    @property
+    def correct_count(self):
+        return len(self.correct_names)
+
+    # Record a users answer and answer time (ms), only the first answer of
+    # each user is recorded. Returns whether the answer was recorded
+    def record(self, user, is_correct, answer_index, answer_time):
+        if user.id in self.answers:
+            return False
+
+        self.answers[user.id] = (self.round_id, user.id, str(user), is_correct,
+                                 answer_index, answer_time)
+        if is_correct:
+            self.correct_names.append(user.name)
+
+        return True
+
+    # The user id and username of every user that answered
+    def usernames(self):
+        return [(answer[1], answer[2]) for answer in self.answers.values()]
+
+    # Insert every recorded answer in a single batch, in the order they were
+    # given. The answers are scored once the round is set as complete
+    async def save(self, db):
+        if len(self.answers) == 0:
+            return
+
+        query = '''INSERT INTO answers (round_id, user_id, username,
+                   is_correct, answer_index, answer_time)
+                   VALUES ($1, $2, $3, $4, $5, $6)
+                '''
+        await db.executemany(query, list(self.answers.values()))
@@ -0,0 +1,82 @@
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+# Anything that isn't a letter or digit is ignored when matching answers
+NON_ALPHANUMERIC = re.compile(r'[^a-z0-9]+')
+LEADING_ARTICLE = re.compile(r'^(the|a|an) (?=.)')
+
+# How similar typed text must be to an answer to count as that answer, and
+# the shortest text compared by similarity
+FUZZY_CUTOFF = 0.8
+MIN_FUZZY_LENGTH = 3
+
+
+# Lowercase text, strip accents and punctuation and collapse whitespace
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return NON_ALPHANUMERIC.sub(' ', text.casefold()).strip()
+
+
+# Matches typed answers to a round's answers, either by the letter an answer
+# is shown with (A, B or C) or by the answer's text, allowing small typos.
+# The answers are normalized once when the round starts, so each message only
+# has its own text normalized and compared
+class AnswerMatcher:
+    def __init__(self, answers, cutoff=FUZZY_CUTOFF):
+        self.cutoff = cutoff
+        self.choices = {chr(index + 97): index
+                        for index in range(len(answers))}
+
+        self.exact = {}
+        self.fuzzy = []
+        for index, answer in enumerate(answers):
+            text = normalize(str(answer))
+            for key in (text, LEADING_ARTICLE.sub('', text)):
+                self.exact.setdefault(key, index)
+
+            # SequenceMatcher caches what it knows of its second sequence
+            matcher = SequenceMatcher(None, autojunk=False)
+            matcher.set_seq2(text)
+            self.fuzzy.append((index, matcher))
+
+        self.max_length = max((len(key) for key in self.exact), default=0) * 2
+
+    # Get the index of the answer the text matches, None if the text doesn't
+    # match exactly one answer
+    def match(self, content):
+        text = normalize(content)
+        index = self.choices.get(text)
+        if index is None:
+            index = self.exact.get(text)
+        if index is None:
+            index = self.exact.get(LEADING_ARTICLE.sub('', text))
+        if index is not None:
+            return index
+
+        if not MIN_FUZZY_LENGTH <= len(text) <= self.max_length:
+            return None
+
+        best_index = None
+        best_ratio = self.cutoff
+        tied = False
+        for index, matcher in self.fuzzy:
+            matcher.set_seq1(text)
+            if matcher.real_quick_ratio() < best_ratio:
+                continue
+            if matcher.quick_ratio() < best_ratio:
+                continue
+
+            ratio = matcher.ratio()
+            if ratio < best_ratio:
+                continue
+
+            if best_index is None or ratio > best_ratio:
+                tied = False
+                best_index = index
+                best_ratio = ratio
+            elif ratio == best_ratio:
+                tied = True
+
+        return None if tied else best_index
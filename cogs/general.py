@@ -4,7 +4,8 @@ import discord
 from discord.ext import commands
 from discord.ext.commands.cooldowns import BucketType
 
-import prefixes
+from vote_reminders import get_next_vote
+
 
 COMMANDS_LIST = '''
 Hi-diddly-ho, neighborino! Here are the commands, shout them out anytime and
@@ -64,6 +65,8 @@ TRIVIA_COMMANDS = '''
 
 **simpsonstrivia** - Play a trivia game using 100+ questions from The Simpsons.
 **futuramatrivia** - Play a game of trivia using 100+ questions from Futurama.
+**simpsonstrivia typed** - Play trivia by typing A, B, C or the answer in chat.
+**futuramatrivia typed** - Play Futurama trivia by typing your answers in chat.
 **suggest** - Posts a link for suggesting some trivia questions of your own.
 **leaderboard** - Shows a leaderboard of trivia users across the globe.
 **scoreboard** - Shows a scoreboard of trivia users in the server.
@@ -111,8 +114,8 @@ class General(commands.Cog):
     @commands.command()
     @commands.cooldown(1, 3, BucketType.user)
     async def info(self, ctx):
-        await self.dm_author(ctx, BOT_INFO + '\n***Currently active '
-                             'in ' + str(len(self.bot.guilds)) + ' servers***')
+        await self.dm_author(ctx, BOT_INFO + '\n***Currently active in ' +
+                             str(self.bot.guild_count()) + ' servers***')
 
     # Whispers a list of the bot commands, If the user has DMs disabled,
     # sends the message in the channel
@@ -139,19 +142,19 @@ class General(commands.Cog):
     @commands.cooldown(1, 3, BucketType.channel)
     @commands.guild_only()
     async def meme(self, ctx, *, meme_caption: str = None):
-        if ctx.channel.id in self.bot.cached_screencaps:
-            screencap = self.bot.cached_screencaps[ctx.channel.id]
-
-            if screencap is not None:
-                gif_url = await screencap.get_gif_url(meme_caption)
-                sent = await ctx.send('Generating meme... ' +
-                                      '<a:loading:410316176510418955>')
-                generated_url = await screencap.api.generate_gif(gif_url)
-                try:
-                    await sent.edit(content=generated_url)
+        screencap = self.bot.cached_screencaps.get(ctx.channel.id)
+
+        if screencap is not None:
+            gif_url = await screencap.get_gif_url(meme_caption)
+            sent = await ctx.send('Generating meme... ' +
+                                  '<a:loading:410316176510418955>')
+            generated_url = await self.bot.gif_cache.generate(screencap.api,
+                                                              gif_url)
+            try:
+                await sent.edit(content=generated_url)
 
-                except discord.NotFound:
-                    pass
+            except discord.NotFound:
+                pass
 
     # Sends the feedback to the feedback channel of support server
     @commands.command()
@@ -181,26 +184,17 @@ class General(commands.Cog):
     @commands.command(aliases=['upvote'])
     @commands.cooldown(1, 30, BucketType.user)
     async def vote(self, ctx):
-        query = '''SELECT MAX(voted_at) FROM vote_history
-                   WHERE user_id = $1 AND vote_type = 'upvote';'''
-
         message = ('If you vote for me using the link below, it will ' +
                    'hel-diddly-elp me grow in popularity!\n' + VOTE_URL + '\n')
 
-        row = await self.bot.db.fetchrow(query, ctx.author.id)
-
-        if row['max'] is not None:
-            time_diff = (datetime.utcnow() - row['max'])
-            seconds_remaining = 43200 - time_diff.seconds
-
-            if seconds_remaining <= 0:
-                message += '**You can vote now.**'
-
-            else:
-                hours, remainder = divmod(seconds_remaining, 3600)
-                minutes, seconds = divmod(remainder, 60)
-                message += ('**You can vote again in: {} hours, {} minutes, '
-                            'and {} seconds.**'.format(hours, minutes, seconds))
+        next_vote = await get_next_vote(self.bot.db, ctx.author.id)
+        if next_vote is not None:
+            seconds_remaining = int((next_vote -
+                                     datetime.utcnow()).total_seconds())
+            hours, remainder = divmod(seconds_remaining, 3600)
+            minutes, seconds = divmod(remainder, 60)
+            message += ('**You can vote again in: {} hours, {} minutes, '
+                        'and {} seconds.**'.format(hours, minutes, seconds))
 
         else:
             message += '**You can vote now.**'
@@ -244,12 +238,11 @@ class General(commands.Cog):
     @commands.command(aliases=['prefixes'])
     @commands.cooldown(1, 3, BucketType.channel)
     async def prefix(self, ctx):
-        guild_prefixes = prefixes.prefixes_for(ctx.message.guild,
-                                               self.bot.prefix_data)
-        if len(guild_prefixes) > 7:
+        custom_prefix = self.bot.prefixes.custom_prefix(ctx.message.guild)
+        if custom_prefix is not None:
             await ctx.send('This servers prefixes are: `Ned`, `ned`, `diddly`' +
                            ', `doodly`,' + ' `diddly-`, `doodly-` and `' +
-                           guild_prefixes[-1] + '`.')
+                           custom_prefix + '`.')
 
         else:
             await ctx.send('This servers prefixes are: `Ned`, `ned`, `diddly`' +
@@ -261,8 +254,7 @@ class General(commands.Cog):
     @commands.has_permissions(manage_guild=True)
     @commands.cooldown(3, 60, BucketType.guild)
     async def setprefix(self, ctx, *, new_prefix: str = None):
-        guild_index = prefixes.find_guild(ctx.message.guild,
-                                          self.bot.prefix_data)
+        custom_prefix = self.bot.prefixes.custom_prefix(ctx.message.guild)
         # Require entering a prefix
         if new_prefix is None:
             await ctx.send('You did not provide a new prefix.')
@@ -271,24 +263,13 @@ class General(commands.Cog):
         elif len(new_prefix) > 10:
             await ctx.send('Custom server prefix too long (Max 10 chars).')
 
-        # Add a new custom guild prefix if one doesn't already exist
-        elif guild_index == -1:
-            self.bot.prefix_data.append(
-                {'guildID': ctx.message.guild.id,
-                 'prefix': new_prefix}
-            )
-            prefixes.write_prefixes(self.bot.prefix_data)
-            await ctx.send('This servers custom prefix changed to `'
-                           + new_prefix + '`.')
-
-        elif self.bot.prefix_data[guild_index]['prefix'] == new_prefix:
+        elif custom_prefix == new_prefix:
             await ctx.send('This server custom prefix is already `' +
                            new_prefix + '`.')
 
-        # Otherwise, modify the current prefix to the new one
+        # Otherwise, add or modify the custom guild prefix
         else:
-            self.bot.prefix_data[guild_index]['prefix'] = new_prefix
-            prefixes.write_prefixes(self.bot.prefix_data)
+            await self.bot.set_prefix(ctx.message.guild.id, new_prefix)
             await ctx.send('This servers custom prefix changed to `' +
                            new_prefix + '`.')
 
@@ -297,12 +278,14 @@ class General(commands.Cog):
     @commands.cooldown(2, 30, BucketType.user)
     async def notifications(self, ctx):
         if ctx.author.id in self.bot.reminders:
-            self.bot.reminders.remove(ctx.author.id)
+            await self.bot.reminders.unsubscribe(ctx.author.id)
             await self.dm_author(ctx, 'You will no longer be notified when you '
                                       'can vote again.')
 
         else:
-            self.bot.reminders.append(ctx.author.id)
+            # Remind the user when they can vote next, if they can't already
+            remind_at = await get_next_vote(self.bot.db, ctx.author.id)
+            await self.bot.reminders.subscribe(ctx.author.id, remind_at)
             try:
                 await self.dm_author(ctx, 'Notifications enabled. You will be '
                                           'notified when you are able to vote.')
@@ -311,32 +294,17 @@ class General(commands.Cog):
                 await ctx.send('You have DMs disabled, please enable DMs if '
                                'you\'d like to enable notifications.')
 
-            # Check if user is able to vote now
-            query = '''SELECT MAX(voted_at) FROM vote_history
-                       WHERE user_id = $1 AND vote_type = 'upvote';'''
-            row = await self.bot.db.fetchrow(query, ctx.author.id)
-
-            # No timestamps in history, notify and exit
-            if row['max'] is None:
+            # No recent vote, notify and exit
+            if remind_at is None:
                 await self.dm_author(ctx, VOTE_URL + '\n**You can vote now.**')
 
-            else:
-                # Calculate seconds until next vote
-                time_diff = (datetime.utcnow() - row['max'])
-                seconds_remaining = 43200 - time_diff.seconds
-
-                # Voted over 12 hours ago, notify and exit
-                if seconds_remaining <= 0:
-                    await self.dm_author(ctx, VOTE_URL +
-                                         '\n**You can vote now.**')
-
     @commands.command(aliases=['toggled'])
     async def toggle(self, ctx):
         if ctx.author.id not in self.bot.reminders:
-            self.bot.reminders.append(ctx.author.id)
+            await self.bot.reminders.subscribe(ctx.author.id)
 
         else:
-            self.bot.reminders.remove(ctx.author.id)
+            await self.bot.reminders.unsubscribe(ctx.author.id)
 
 
 def setup(bot):
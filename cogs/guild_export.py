@@ -0,0 +1,108 @@
+import csv
+import gzip
+import json
+
+# Column headers of csv exports, and the matching keys of json lines exports
+CSV_HEADER = ['Server Name', '# of Bots', '# of Users', 'Total', 'Region',
+              'Features']
+JSON_KEYS = ['name', 'bots', 'users', 'total', 'region', 'features']
+
+# File formats guilds can be exported as
+EXPORT_FORMATS = ['csv', 'jsonl']
+
+
+# Exports the name, member counts, region and features of every guild to a
+# csv or json lines file, optionally gzipped. Member counts come from the
+# bot's member counter where it has them, otherwise rows are built on the
+# event loop a chunk of members at a time. Rows are written by a worker
+# thread, so a large export never blocks the loop for long
+class GuildExport:
+    def __init__(self, loop, file_format='csv', compress=False,
+                 members_per_chunk=10000, directory='cogs/data'):
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError('Unknown export format: ' + file_format)
+
+        self.loop = loop
+        self.file_format = file_format
+        self.compress = compress
+        self.members_per_chunk = members_per_chunk
+        self.file_path = '{}/guildlist.{}'.format(directory, file_format)
+        if compress:
+            self.file_path += '.gz'
+
+        self.file = None
+        self.writer = None
+        self.rows = 0
+
+    # Write a row for every guild, returns the path of the exported file
+    async def export(self, guilds, member_counts=None):
+        await self.loop.run_in_executor(None, self.open)
+        try:
+            chunk = []
+            chunk_members = 0
+            for guild in guilds:
+                if member_counts is not None and guild.id in member_counts:
+                    chunk.append(self.counted_guild_row(
+                        guild, member_counts[guild.id]))
+                    chunk_members += 1
+
+                else:
+                    chunk.append(self.guild_row(guild))
+                    chunk_members += len(guild.members)
+
+                # Writing the chunk hands the loop back to other tasks
+                if chunk_members >= self.members_per_chunk:
+                    await self.loop.run_in_executor(None, self.write_rows,
+                                                    chunk)
+                    chunk = []
+                    chunk_members = 0
+
+            await self.loop.run_in_executor(None, self.write_rows, chunk)
+
+        finally:
+            await self.loop.run_in_executor(None, self.close)
+
+        return self.file_path
+
+    # Guild name, bot count, user count, total member count, region and
+    # features
+    @staticmethod
+    def guild_row(guild):
+        members = guild.members
+        bot_count = sum(1 for member in members if member.bot)
+        return [guild.name, bot_count, len(members) - bot_count, len(members),
+                str(guild.region), list(guild.features)]
+
+    # The same row built from the guild's counts in the member counter
+    @staticmethod
+    def counted_guild_row(guild, counts):
+        return [guild.name, counts.bots, counts.members - counts.bots,
+                counts.members, str(guild.region), list(guild.features)]
+
+    def open(self):
+        if self.compress:
+            self.file = gzip.open(self.file_path, 'wt', newline='',
+                                  encoding='utf-8')
+        else:
+            self.file = open(self.file_path, 'w', newline='',
+                             encoding='utf-8')
+
+        if self.file_format == 'csv':
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(CSV_HEADER)
+
+    def write_rows(self, rows):
+        if self.file_format == 'csv':
+            self.writer.writerows(row[:-1] + [' '.join(row[-1])]
+                                  for row in rows)
+
+        else:
+            for row in rows:
+                self.file.write(json.dumps(dict(zip(JSON_KEYS, row))) + '\n')
+
+        self.rows += len(rows)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
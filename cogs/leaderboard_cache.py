@@ -0,0 +1,89 @@
+import time
+
+import asyncio
+
+# Every stat shown on the leaderboard, each query is served by a covering
+# index on the stat so only the top rows are read
+LEADERBOARD_STATS = [
+    {"query": "SELECT username, score AS result "
+              "FROM leaderboard ORDER BY score DESC LIMIT $1",
+     "category": ":trophy: High Scores"},
+    {"query": "SELECT username, wins AS result "
+              "FROM leaderboard ORDER BY wins DESC LIMIT $1",
+     "category": ":first_place: Wins"},
+    {"query": "SELECT username, correct_answers AS result "
+              "FROM leaderboard ORDER BY correct_answers DESC LIMIT $1",
+     "category": ":white_check_mark:  Correct Answers"},
+    {"query": "SELECT username, CONCAT(CAST(fastest_answer AS FLOAT) "
+              "/ 1000, 's') AS result "
+              "FROM leaderboard ORDER BY fastest_answer ASC LIMIT $1",
+     "category": ":point_up: Fastest Answers"},
+    {"query": "SELECT username, longest_streak AS result "
+              "FROM leaderboard ORDER BY longest_streak DESC LIMIT $1",
+     "category": ":chart_with_upwards_trend: Longest Streak"}
+]
+
+
+# Keeps the top players of every leaderboard stat in memory. The cache is
+# marked stale whenever a match ends, and a stale cache is refreshed at most
+# every min_age seconds however many matches end in between. Otherwise it's
+# refreshed every max_age seconds, so the leaderboard command rarely touches
+# the DB
+class LeaderboardCache:
+    def __init__(self, size=5, min_age=30, max_age=300):
+        self.size = size
+        self.min_age = min_age
+        self.max_age = max_age
+        self.fields = None
+        self.stale = False
+        self.refreshed_at = 0
+        self.hits = 0
+        self.refreshes = 0
+        self.refresh_lock = asyncio.Lock()
+
+    # Mark the cached leaderboard as out of date, e.g. when a match ends
+    def mark_stale(self):
+        self.stale = True
+
+    def is_fresh(self):
+        if self.fields is None:
+            return False
+
+        age = time.monotonic() - self.refreshed_at
+        return age < (self.min_age if self.stale else self.max_age)
+
+    # Get the (category, scores) fields for the leaderboard, refreshing from
+    # the DB only if the cache is stale. Concurrent callers share a refresh
+    async def get_fields(self, db):
+        if self.is_fresh():
+            self.hits += 1
+            return self.fields
+
+        async with self.refresh_lock:
+            if not self.is_fresh():
+                await self.refresh(db)
+
+            return self.fields
+
+    # Query the top players of every stat
+    async def refresh(self, db):
+        # A match ending while the queries run marks the cache stale again
+        self.stale = False
+        fields = []
+        async with db.acquire() as conn:
+            for stat in LEADERBOARD_STATS:
+                rows = await conn.fetch(stat['query'], self.size)
+
+                # Nobody has played trivia yet
+                if len(rows) == 0:
+                    break
+
+                scores = ''
+                for row in rows:
+                    scores += (f'**{row["username"]}**: '
+                               f'{str(row["result"])}\n')
+                fields.append((stat['category'], scores))
+
+        self.fields = fields
+        self.refreshed_at = time.monotonic()
+        self.refreshes += 1
@@ -0,0 +1,210 @@
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import asyncio
+
+
+# Raised when trivia is too busy to start or queue another match
+class MatchRejected(Exception):
+    pass
+
+
+# A trivia match being played, or waiting to be played, in a channel
+class Match:
+    __slots__ = ('channel_id', 'playing', 'waiter')
+
+    def __init__(self, channel_id):
+        self.channel_id = channel_id
+        self.playing = True
+
+        # Set once a queued match is given a slot
+        self.waiter = None
+
+    @property
+    def admitted(self):
+        return self.waiter is None or (self.waiter.done() and
+                                       not self.waiter.cancelled())
+
+
+# Tracks the trivia matches of every channel by channel id and runs the
+# timers of every round on one heap, so a single task wakes each round once
+# its timer ends no matter how many matches are being played. At most
+# max_matches are played at once, and while the DB is slow new matches only
+# start while nothing else is being played. Others wait in a queue for a
+# slot, or are rejected once the queue is full or they've waited too long
+class MatchScheduler:
+    def __init__(self, loop, max_matches=500, max_queued=100, queue_timeout=30,
+                 max_db_latency=0.5, latency_weight=0.2):
+        self.loop = loop
+        self.max_matches = max_matches
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.max_db_latency = max_db_latency
+        self.latency_weight = latency_weight
+
+        self.matches = {}
+        self.queue = deque()
+        self.running = 0
+
+        # Heap of (wake_at, sequence, future), an entry is stale once its
+        # future is done
+        self.heap = []
+        self.sequence = itertools.count()
+        self.rescheduled = asyncio.Event()
+        self.task = None
+
+        # Moving average of DB query latency in seconds
+        self.db_latency = 0.0
+
+        self.started = 0
+        self.waited = 0
+        self.rejected = 0
+
+    def __contains__(self, channel_id):
+        return channel_id in self.matches
+
+    def __len__(self):
+        return len(self.matches)
+
+    def is_busy(self):
+        return (self.running >= self.max_matches or
+                (self.running > 0 and self.db_latency > self.max_db_latency))
+
+    def is_playing(self, channel_id):
+        match = self.matches.get(channel_id)
+        return match is not None and match.playing
+
+    # Claim the channel for a new match, queueing it when trivia is busy.
+    # Raises MatchRejected when the queue is full
+    def add(self, channel_id):
+        match = Match(channel_id)
+        if not self.is_busy():
+            self.running += 1
+            self.started += 1
+
+        elif len(self.queue) < self.max_queued:
+            match.waiter = self.loop.create_future()
+            self.queue.append(match)
+            self.waited += 1
+
+        else:
+            self.rejected += 1
+            raise MatchRejected('Trivia is at capacity')
+
+        self.matches[channel_id] = match
+        return match
+
+    # Wait for a queued match to be given a slot, raises MatchRejected if it
+    # isn't given one within the queue timeout
+    async def wait(self, match):
+        if match.admitted:
+            return
+
+        try:
+            await asyncio.wait_for(match.waiter, self.queue_timeout)
+
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise MatchRejected('Timed out waiting for a free slot')
+
+    # End the match after its current round, returns whether it was playing
+    def stop(self, channel_id):
+        match = self.matches.get(channel_id)
+        if match is None or not match.playing:
+            return False
+
+        match.playing = False
+        return True
+
+    # Release the channel, and the match's slot if it was given one, once the
+    # match is over or stopped waiting
+    def finish(self, match):
+        if self.matches.get(match.channel_id) is match:
+            del self.matches[match.channel_id]
+
+        if match.admitted:
+            self.running -= 1
+            self.admit()
+
+        elif match in self.queue:
+            self.queue.remove(match)
+
+    # Give free slots to queued matches in the order they were queued,
+    # skipping any that stopped waiting
+    def admit(self):
+        while self.queue and not self.is_busy():
+            match = self.queue.popleft()
+            if match.waiter.done():
+                continue
+
+            self.running += 1
+            self.started += 1
+            match.waiter.set_result(None)
+
+    # Time a DB query, e.g. with self.timed(): await db.execute(...)
+    @contextmanager
+    def timed(self):
+        start = time.monotonic()
+        yield
+        latency = time.monotonic() - start
+        self.db_latency += self.latency_weight * (latency - self.db_latency)
+        self.admit()
+
+    # Sleep until the monotonic time wake_at
+    async def sleep_until(self, wake_at):
+        if self.task is None:
+            self.task = self.loop.create_task(self.run())
+
+        future = self.loop.create_future()
+        entry = (wake_at, next(self.sequence), future)
+        heapq.heappush(self.heap, entry)
+        if self.heap[0] is entry:
+            self.rescheduled.set()
+
+        await future
+
+    # Sleep until the next timer ends, wake every ended timer and repeat.
+    # Wakes early when a timer is added that ends before the next one
+    async def run(self):
+        while True:
+            timeout = None
+            if self.heap:
+                timeout = max(0, self.heap[0][0] - time.monotonic())
+
+            try:
+                await asyncio.wait_for(self.rescheduled.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+            self.rescheduled.clear()
+            now = time.monotonic()
+            while self.heap and self.heap[0][0] <= now:
+                future = heapq.heappop(self.heap)[2]
+                if not future.done():
+                    future.set_result(None)
+
+    # Stop the timer task, cancelling every sleeping round
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+        for wake_at, sequence, future in self.heap:
+            future.cancel()
+        self.heap = []
+
+    # Match, queue and DB latency counters
+    def metrics(self):
+        return {
+            'running': self.running,
+            'queued': len(self.queue),
+            'max_matches': self.max_matches,
+            'timers': len(self.heap),
+            'started': self.started,
+            'waited': self.waited,
+            'rejected': self.rejected,
+            'db_latency': self.db_latency
+        }
@@ -0,0 +1,95 @@
+# Every scoreboard stat of every player in a match, in a single grouped pass
+# over the match's answers
+MATCH_SUMMARY_QUERY = '''
+    SELECT a.user_id, MIN(a.username) AS username, COUNT(*) AS answered,
+           COUNT(CASE WHEN a.is_correct THEN 1 END) AS correct,
+           MIN(a.answer_time) AS fastest_time,
+           MIN(CASE WHEN a.is_correct THEN a.answer_time END)
+           AS fastest_correct
+    FROM answers a
+    INNER JOIN rounds r
+    ON a.round_id = r.round_id
+    WHERE r.match_id = $1
+    GROUP BY a.user_id;
+'''
+
+
+# The name a player is shown with, from the username stored with their
+# answers (name#discriminator)
+def display_name(username):
+    return username.rsplit('#', 1)[0]
+
+
+# The answers a single player gave in a match
+class PlayerSummary:
+    __slots__ = ('user_id', 'name', 'answered', 'correct', 'fastest_time',
+                 'fastest_correct')
+
+    def __init__(self, user_id, username, answered=0, correct=0,
+                 fastest_time=None, fastest_correct=None):
+        self.user_id = user_id
+        self.name = display_name(username)
+        self.answered = answered
+        self.correct = correct
+        self.fastest_time = fastest_time
+        self.fastest_correct = fastest_correct
+
+    @property
+    def accuracy(self):
+        return self.correct / self.answered
+
+    def add_answer(self, is_correct, answer_time):
+        self.answered += 1
+        if self.fastest_time is None or answer_time < self.fastest_time:
+            self.fastest_time = answer_time
+
+        if is_correct:
+            self.correct += 1
+            if (self.fastest_correct is None or
+                    answer_time < self.fastest_correct):
+                self.fastest_correct = answer_time
+
+
+# One summary per player of a match, built up round by round from the
+# round's answers as they are collected, or read from the DB in one query
+class MatchSummary:
+    def __init__(self):
+        self.players = {}
+
+    def __len__(self):
+        return len(self.players)
+
+    # Add the answers collected in a round
+    def add_round(self, collector):
+        for (round_id, user_id, username, is_correct, answer_index,
+             answer_time) in collector.answers.values():
+            player = self.players.get(user_id)
+            if player is None:
+                player = PlayerSummary(user_id, username)
+                self.players[user_id] = player
+
+            player.add_answer(is_correct, answer_time)
+
+    @classmethod
+    async def from_db(cls, db, match_id):
+        summary = cls()
+        for row in await db.fetch(MATCH_SUMMARY_QUERY, match_id):
+            summary.players[row['user_id']] = PlayerSummary(*row.values())
+
+        return summary
+
+    # Players by correct answers, ties broken by fastest answer the same way
+    # the match winner is
+    def top_scorers(self, limit=5):
+        return sorted(self.players.values(),
+                      key=lambda p: (-p.correct, p.fastest_time))[:limit]
+
+    def most_accurate(self, limit=5):
+        return sorted(self.players.values(),
+                      key=lambda p: -p.accuracy)[:limit]
+
+    # Players with a correct answer by their fastest correct answer
+    def fastest_answers(self, limit=5):
+        return sorted((p for p in self.players.values()
+                       if p.fastest_correct is not None),
+                      key=lambda p: p.fastest_correct)[:limit]
@@ -0,0 +1,34 @@
+import time
+
+
+# Routes messages to the handler registered for the channel they were sent
+# in, a single dict lookup per message no matter how many channels are
+# waiting for messages. Handlers are called with the message and the
+# monotonic time the message was received
+class MessageDispatcher:
+    def __init__(self):
+        self.handlers = {}
+        self.dispatched = 0
+
+    def __len__(self):
+        return len(self.handlers)
+
+    # Call handler(message, received_at) for every message sent in the
+    # channel until it's unregistered
+    def register(self, channel_id, handler):
+        self.handlers[channel_id] = handler
+
+    def unregister(self, channel_id):
+        self.handlers.pop(channel_id, None)
+
+    # Pass a message to the handler of its channel, returns whether the
+    # channel had a handler
+    def dispatch(self, message):
+        received_at = time.monotonic()
+        handler = self.handlers.get(message.channel.id)
+        if handler is None:
+            return False
+
+        handler(message, received_at)
+        self.dispatched += 1
+        return True
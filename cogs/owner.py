@@ -6,6 +6,18 @@ import aiohttp
 import discord
 from discord.ext import commands
 
+from cogs.guild_export import EXPORT_FORMATS
+from cogs.guild_export import GuildExport
+from cogs.tvshows import TVShowCog
+
+
+# Format a duration in seconds as milliseconds for display
+def format_ms(seconds):
+    if seconds is None:
+        return '---'
+
+    return '{}ms'.format(round(seconds * 1000, 2))
+
 
 class Owner(commands.Cog):
     def __init__(self, bot):
@@ -25,9 +37,8 @@ class Owner(commands.Cog):
     @commands.command(hidden=True)
     @commands.is_owner()
     async def status(self, ctx, *, message: str):
-        new_status = discord.Game(name=message.format(len(self.bot.guilds)))
-        await self.bot.change_presence(activity=new_status)
         self.bot.status_formats = [message]
+        self.bot.presence.request_update()
         await ctx.send('Status changed!')
 
     # Add a status/presence format to the status cycle
@@ -35,6 +46,7 @@ class Owner(commands.Cog):
     @commands.is_owner()
     async def addstatus(self, ctx, *, message: str):
         self.bot.status_formats.append(message)
+        self.bot.presence.request_update()
         await ctx.send('Status added!')
 
     # Resets the status/presence formats to cycle through two original formats
@@ -43,6 +55,7 @@ class Owner(commands.Cog):
     async def resetstatus(self, ctx):
         self.bot.status_formats = ['Ned vote | {} Servers',
                                    'Ned help | {} Servers']
+        self.bot.presence.request_update()
         await ctx.send('Status reset!')
 
     # Get the number of all the commands executed
@@ -50,12 +63,117 @@ class Owner(commands.Cog):
     @commands.is_owner()
     async def commandstats(self, ctx):
         command_count = ''
-        for key in self.bot.command_stats:
-            command_count += (key + ': ' + str(self.bot.command_stats[key]) +
-                              '\n')
+        counts = self.bot.command_stats.cluster_counts()
+        for key in counts:
+            command_count += (key + ': ' + str(counts[key]) + '\n')
+
+        # Include how far behind the json file is and how long writes take
+        metrics = self.bot.command_stats.metrics()
+        command_count += ('\nPending: {} | Flushes: {} | Last flush: {} | '
+                          'Max flush: {}'.format(
+                              metrics['pending'], metrics['flush_count'],
+                              format_ms(metrics['last_flush_latency']),
+                              format_ms(metrics['max_flush_latency'])))
 
         await ctx.send(command_count)
 
+    # Get the hit rates and latencies of the screencap caches of each tv show
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def cachestats(self, ctx):
+        cache_stats = ''
+        for cog in self.bot.cogs.values():
+            if not isinstance(cog, TVShowCog):
+                continue
+
+            pool = cog.screencap_pool.metrics()
+            hit_rate = ('---' if pool['hit_rate'] is None else
+                        '{}%'.format(round(pool['hit_rate'] * 100, 1)))
+            cache_stats += ('**{}**\nRandom pool: {}/{} | Hit rate: {} | '
+                            'Refills: {} ({} failed) | Refill latency: {} '
+                            '(last {})\n'.format(
+                                cog.api.title, pool['size'], pool['capacity'],
+                                hit_rate, pool['refills'],
+                                pool['refill_errors'],
+                                format_ms(pool['average_refill_latency']),
+                                format_ms(pool['last_refill_latency'])))
+
+            search = cog.search_cache.metrics()
+            hit_rate = ('---' if search['hit_rate'] is None else
+                        '{}%'.format(round(search['hit_rate'] * 100, 1)))
+            cache_stats += ('Search cache: {}/{} | Hit rate: {} | Hits: {} | '
+                            'Misses: {} | Evictions: {} | Expired: {} | '
+                            'Coalesced: {}\n'.format(
+                                search['size'], search['max_size'], hit_rate,
+                                search['hits'], search['misses'],
+                                search['evictions'], search['expirations'],
+                                cog.searches.coalesced))
+
+        # Generated gifs
+        gifs = self.bot.gif_cache.metrics()
+        cache_stats += ('**Generated Gifs**\nIn memory: {}/{} | Memory hits: {}'
+                        ' | Disk hits: {} | Generated: {} | Coalesced: {}\n'.
+                        format(gifs['size'], gifs['max_size'], gifs['hits'],
+                               gifs['disk_hits'], gifs['generated'],
+                               gifs['coalesced']))
+
+        # Last screencap posted in each channel
+        store = self.bot.cached_screencaps.memory_stats()
+        cache_stats += ('**Channel Screencaps**\nChannels: {}/{} | Memory: '
+                        '{}KB | Evictions: {} | Expired: {}\n'.format(
+                            store['size'], store['max_size'],
+                            round(store['bytes'] / 1024, 1),
+                            store['evictions'], store['expirations']))
+
+        # Member counts used by stats and guildlist
+        members = self.bot.member_counts.metrics()
+        cache_stats += ('**Member Counts**\nGuilds: {} | Members: {} | '
+                        'Bots: {} | Online: {} | Recounts: {} | Drift: {} | '
+                        'Last recount: {}\n'.format(
+                            members['guilds'], members['members'],
+                            members['bots'], members['online'],
+                            members['reconciles'], members['drift'],
+                            format_ms(members['last_reconcile_duration'])))
+
+        await ctx.send(cache_stats)
+
+    # Get the state of the vote listener and vote reminders
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def votestats(self, ctx):
+        listener = self.bot.vote_listener.metrics()
+        reminders = self.bot.reminders.metrics()
+        await ctx.send('**Vote Listener**\nConnected: {} | Notifications: {} | '
+                       'Votes: {} | Reconnects: {} | Lag: {} (max {}) | '
+                       'Caught up to: {}\n**Vote Reminders**\nSubscribers: {} '
+                       '| Pending: {} | Sent: {} | Failed: {}'.format(
+                           listener['connected'], listener['notifications'],
+                           listener['votes'], listener['reconnects'],
+                           format_ms(listener['last_lag']),
+                           format_ms(listener['max_lag']),
+                           listener['watermark'], reminders['subscribers'],
+                           reminders['pending'], reminders['sent'],
+                           reminders['failed']))
+
+    # Get the number of trivia matches being played and queued
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def triviastats(self, ctx):
+        trivia = self.bot.get_cog('Trivia')
+        if trivia is None:
+            await ctx.send('Trivia is not loaded.')
+            return
+
+        matches = trivia.matches.metrics()
+        await ctx.send('**Trivia Matches**\nPlaying: {}/{} | Queued: {} | '
+                       'Round timers: {} | Started: {} | Waited: {} | '
+                       'Rejected: {} | DB latency: {}'.format(
+                           matches['running'], matches['max_matches'],
+                           matches['queued'], matches['timers'],
+                           matches['started'], matches['waited'],
+                           matches['rejected'],
+                           format_ms(matches['db_latency'])))
+
     # Loads a cog (requires dot path)
     @commands.command(hidden=True)
     @commands.is_owner()
@@ -105,37 +223,29 @@ class Owner(commands.Cog):
             response = await self.bot.wait_for('message', check=check,
                                                timeout=10)
             await response.add_reaction('✅')
-            await self.bot.db.close()
-            await self.bot.logout()
-            await self.bot.close()
+            await self.bot.shutdown()
 
         except asyncio.TimeoutError:
             pass
 
     # Generates a list of guilds the bot is in, contains name, bot and user
-    # counts
+    # counts. Exported as csv or json lines, optionally gzipped
     @commands.command(hidden=True)
     @commands.is_owner()
-    async def guildlist(self, ctx):
-        with open('cogs/data/guildlist.csv', 'w') as guild_list:
-            guild_list.write('Server Name,# of Bots,# of Users,Total,Region,'
-                             'Features\n')
-            for guild in self.bot.guilds:
-                bot_count = 0
-                for member in guild.members:
-                    if member.bot:
-                        bot_count += 1
-
-                # Write to csv file (guild name, bot count, user count,
-                #  total member count)
-                guild_list.write('"' + guild.name + '",' +
-                                 str(bot_count) + ',' +
-                                 str(len(guild.members) - bot_count) + ',' +
-                                 str(len(guild.members)) + ',' +
-                                 str(guild.region) + ',' +
-                                 str(guild.features) + '\n')
-
-        await ctx.send(file=discord.File('cogs/data/guildlist.csv'))
+    async def guildlist(self, ctx, file_format='csv', compress=''):
+        # e.g. guildlist jsonl gz
+        try:
+            export = GuildExport(self.bot.loop, file_format.lower(),
+                                 compress.lower() in ('gz', 'gzip'))
+
+        except ValueError:
+            await ctx.send('Formats: ' + ', '.join(EXPORT_FORMATS) +
+                           ' (add gz to compress)')
+            return
+
+        file_path = await export.export(self.bot.guilds,
+                                        self.bot.member_counts)
+        await ctx.send(file=discord.File(file_path))
 
     # Reload config json file, allows regen of bot listing tokens without taking
     # bot down
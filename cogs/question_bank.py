@@ -0,0 +1,89 @@
+import itertools
+import json
+import random
+from functools import lru_cache
+
+from cogs.answer_matcher import AnswerMatcher
+
+
+# Every order a question's answers can be shown in
+@lru_cache(maxsize=None)
+def answer_orders(answer_count):
+    return tuple(itertools.permutations(range(answer_count)))
+
+
+# A question's answers in one of the orders they can be shown in, with the
+# answer lines of the question and the result of a round already rendered
+class QuestionLayout:
+    __slots__ = ('answers', 'correct_index', 'correct_choice', 'answer_lines',
+                 'result_lines', 'matcher')
+
+    def __init__(self, question, order):
+        self.answers = tuple(question.answers[i] for i in order)
+        self.correct_index = order.index(0)
+        self.correct_choice = chr(self.correct_index + 65)
+        self.answer_lines = ''.join(
+            f'**{chr(index + 65)}:** {answer} \n'
+            for index, answer in enumerate(self.answers)) + '\n'
+        self.result_lines = (f'**{self.correct_choice}:** '
+                             f'{question.answers[0]}\n'
+                             f'**Source:** <{question.source}> \n\n')
+        self.matcher = None
+
+    # Get the matcher of typed answers, built the first time the layout is
+    # played with typed answers
+    def get_matcher(self):
+        if self.matcher is None:
+            self.matcher = AnswerMatcher(self.answers)
+
+        return self.matcher
+
+
+# A single trivia question, the first answer is always the correct answer.
+# The question_id is the question's index in the trivia file, which is what
+# gets stored as the question_index of each round
+class Question:
+    __slots__ = ('question_id', 'question', 'answers', 'source', 'layouts')
+
+    def __init__(self, question_id, question, answers, source):
+        self.question_id = question_id
+        self.question = question
+        self.answers = answers
+        self.source = source
+        self.layouts = tuple(QuestionLayout(self, order)
+                             for order in answer_orders(len(answers)))
+
+    # Pick the order the answers are shown in for a round
+    def random_layout(self):
+        return random.choice(self.layouts)
+
+
+# All questions of a trivia category, loaded from its trivia file once and
+# shared between every match of that category
+class QuestionBank:
+    def __init__(self, questions):
+        self.questions = questions
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __getitem__(self, question_id):
+        return self.questions[question_id]
+
+    # Get the question ids in a random order for a new match
+    def shuffled_ids(self):
+        question_ids = list(range(len(self.questions)))
+        random.shuffle(question_ids)
+        return question_ids
+
+    # Load all the questions from a trivia json file
+    @classmethod
+    def from_file(cls, file_path):
+        with open(file_path, 'r') as trivia_data:
+            trivia = json.load(trivia_data)
+
+        return cls(tuple(
+            Question(question_id, question_data['question'],
+                     tuple(question_data['answers']), question_data['source'])
+            for question_id, question_data in enumerate(trivia)
+        ))
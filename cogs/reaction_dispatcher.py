@@ -0,0 +1,35 @@
+import time
+
+
+# Routes reactions to the handler registered for the message they were added
+# to, a single dict lookup per reaction no matter how many messages are
+# waiting for reactions. Handlers are called with the reaction, the user and
+# the monotonic time the reaction was received, so timings aren't skewed by
+# how long the handler's task takes to be scheduled
+class ReactionDispatcher:
+    def __init__(self):
+        self.handlers = {}
+        self.dispatched = 0
+
+    def __len__(self):
+        return len(self.handlers)
+
+    # Call handler(reaction, user, received_at) for every reaction added to
+    # the message until it's unregistered
+    def register(self, message_id, handler):
+        self.handlers[message_id] = handler
+
+    def unregister(self, message_id):
+        self.handlers.pop(message_id, None)
+
+    # Pass a reaction to the handler of its message, returns whether the
+    # message had a handler
+    def dispatch(self, reaction, user):
+        received_at = time.monotonic()
+        handler = self.handlers.get(reaction.message.id)
+        if handler is None:
+            return False
+
+        handler(reaction, user, received_at)
+        self.dispatched += 1
+        return True
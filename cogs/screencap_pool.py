@@ -0,0 +1,93 @@
+import time
+from collections import deque
+
+import aiohttp
+import asyncio
+
+import compuglobal
+
+
+# Keeps a bounded pool of random screencaps, each with its gif already
+# generated, so random gifs can be posted without waiting on the API. Every
+# screencap taken from the pool is replaced in the background, with at most
+# `concurrency` screencaps being fetched at once
+class ScreencapPool:
+    def __init__(self, loop, api, size=5, concurrency=2):
+        self.loop = loop
+        self.api = api
+        self.size = size
+        self.pool = deque(maxlen=size)
+        self.refill_semaphore = asyncio.Semaphore(concurrency)
+        self.refill_tasks = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_errors = 0
+        self.refill_time = 0.0
+        self.last_refill_latency = None
+
+    def __len__(self):
+        return len(self.pool)
+
+    # Take a (screencap, generated gif url) pair from the pool, or None if the
+    # pool is empty, and start replacing it
+    def take(self):
+        if len(self.pool) > 0:
+            self.hits += 1
+            entry = self.pool.popleft()
+
+        else:
+            self.misses += 1
+            entry = None
+
+        self.refill()
+        return entry
+
+    # Start fetching enough screencaps to fill the pool
+    def refill(self):
+        missing = self.size - len(self.pool) - len(self.refill_tasks)
+        for _ in range(missing):
+            task = self.loop.create_task(self.fetch())
+            self.refill_tasks.add(task)
+            task.add_done_callback(self.refill_tasks.discard)
+
+    # Fetch a random screencap and generate its gif
+    async def fetch(self):
+        async with self.refill_semaphore:
+            start = time.perf_counter()
+            try:
+                screencap = await self.api.get_random_screencap()
+                gif_url = await screencap.get_gif_url()
+                generated_url = await self.api.generate_gif(gif_url)
+
+            except (compuglobal.APIPageStatusError, aiohttp.ClientError,
+                    asyncio.TimeoutError):
+                self.refill_errors += 1
+                return
+
+            self.last_refill_latency = time.perf_counter() - start
+            self.refill_time += self.last_refill_latency
+            self.refills += 1
+            self.pool.append((screencap, str(generated_url)))
+
+    # Cancel all refills in progress
+    def close(self):
+        for task in list(self.refill_tasks):
+            task.cancel()
+
+    # Pool hit rate and refill latency metrics
+    def metrics(self):
+        requests = self.hits + self.misses
+        return {
+            'size': len(self.pool),
+            'capacity': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests > 0 else None,
+            'refills': self.refills,
+            'refill_errors': self.refill_errors,
+            'last_refill_latency': self.last_refill_latency,
+            'average_refill_latency': (self.refill_time / self.refills
+                                       if self.refills > 0 else None)
+        }
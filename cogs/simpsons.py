@@ -30,7 +30,7 @@ class Simpsons(TVShowCog):
         sent = await ctx.send('Steaming your hams...'
                               + '<a:loading:410316176510418955>')
 
-        generated_url = await self.api.generate_gif(gif_url)
+        generated_url = await self.bot.gif_cache.generate(self.api, gif_url)
         try:
             await sent.edit(content=generated_url)
 
@@ -25,6 +25,27 @@ class Stats(commands.Cog):
             return ('{}d {}h {}m {}s'.
                     format(days, hours, minutes, seconds))
 
+    # Get the guild count and latency of each shard run by this process, one
+    # line per shard. Summarised if it would be longer than max_length
+    def get_shard_summary(self, max_length=1024):
+        shard_counts = self.bot.shard_guild_counts()
+        latencies = dict(self.bot.latencies)
+        lines = []
+        for shard_id in sorted(shard_counts):
+            latency = round(latencies.get(shard_id, 0) * 1000, 2)
+            lines.append('#{}: {} servers ({}ms)'.format(
+                shard_id, shard_counts[shard_id], latency))
+
+        summary = '\n'.join(lines)
+        if len(summary) <= max_length:
+            return summary
+
+        guild_counts = shard_counts.values()
+        return ('{} shards, {}-{} servers per shard, {}-{}ms latency'.format(
+            len(shard_counts), min(guild_counts), max(guild_counts),
+            round(min(latencies.values()) * 1000, 2),
+            round(max(latencies.values()) * 1000, 2)))
+
     # Posts the bots uptime to the channel
     @commands.command()
     @commands.cooldown(1, 3, BucketType.user)
@@ -36,16 +57,25 @@ class Stats(commands.Cog):
     @commands.cooldown(1, 3, BucketType.channel)
     async def ping(self, ctx):
         latency = round(self.bot.latency * 1000, 2)
-        await ctx.send('🏓 Latency: ' + str(latency) + 'ms')
+        message = '🏓 Latency: ' + str(latency) + 'ms'
+
+        # Include the latency of each shard when running multiple shards
+        if len(self.bot.latencies) > 1:
+            if ctx.guild is not None:
+                message += ' (This server: shard #{})'.format(
+                    ctx.guild.shard_id)
+            message += '\n```' + self.get_shard_summary(1900) + '```'
+
+        await ctx.send(message)
 
     # Get all episode information of the last screencap that was posted in the
     # channel
     @commands.command(aliases=['episodeinfo'])
     @commands.cooldown(1, 3, BucketType.channel)
     async def epinfo(self, ctx):
-        if ctx.channel.id in self.bot.cached_screencaps:
-            # Get screencap and its timestamp
-            screencap = self.bot.cached_screencaps[ctx.channel.id]
+        # Get screencap and its timestamp
+        screencap = self.bot.cached_screencaps.get(ctx.channel.id)
+        if screencap is not None:
             real_timestamp = screencap.get_real_timestamp()
 
             # Create embed for episode information, links to wiki of episode
@@ -69,20 +99,14 @@ class Stats(commands.Cog):
     @commands.cooldown(1, 3, BucketType.channel)
     async def stats(self, ctx):
         # Count users online in guilds and user average
-        total_members = 0
-        online_users = 0
-        for guild in self.bot.guilds:
-            total_members += len(guild.members)
-            for member in guild.members:
-                if member.status == discord.Status.online:
-                    online_users += 1
-        user_average = round((online_users / len(self.bot.guilds)), 2)
-        guild_count = str(len(self.bot.guilds))
+        counts = self.bot.member_counts.metrics()
+        total_members = counts['members']
+        online_users = counts['online']
+        user_average = round((online_users / max(counts['guilds'], 1)), 2)
+        guild_count = str(self.bot.guild_count())
 
         # Count number of commands executed
-        command_count = 0
-        for key in self.bot.command_stats:
-            command_count += self.bot.command_stats[key]
+        command_count = self.bot.command_stats.total()
 
         # Embed statistics output
         embed = discord.Embed(colour=discord.Colour(0x44981e))
@@ -99,6 +123,8 @@ class Stats(commands.Cog):
         embed.add_field(name='Average Online', value=user_average, inline=True)
         embed.add_field(name='Uptime', value=self.get_uptime(), inline=True)
         embed.add_field(name='Commands Used', value=command_count, inline=True)
+        embed.add_field(name='Shards', value=self.get_shard_summary(),
+                        inline=False)
         await ctx.send(embed=embed)
 
 
@@ -1,41 +1,69 @@
 import asyncio
-import json
-import random
 import time
 
 import discord
 from discord.ext import commands
 from discord.ext.commands import BucketType
 
+from cogs.answer_collector import AnswerCollector
+from cogs.leaderboard_cache import LeaderboardCache
+from cogs.match_scheduler import MatchRejected
+from cogs.match_scheduler import MatchScheduler
+from cogs.match_summary import MatchSummary
+from cogs.message_dispatcher import MessageDispatcher
+from cogs.question_bank import QuestionBank
+from cogs.reaction_dispatcher import ReactionDispatcher
 from cogs.trivia_category import FuturamaTrivia
 from cogs.trivia_category import SimpsonsTrivia
+from cogs.username_sync import UsernameSync
+
+# Modes that have answers typed in chat instead of added as reactions
+TYPED_MODES = ['typed', 'type', 'text']
+
+# How to answer, shown below the answers of each question
+REACTION_PROMPT = 'React below to answer!'
+TYPED_PROMPT = 'Type A, B, C or the answer to answer!'
 
 
 class Trivia(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.TIMER_DURATION = 16
-        self.channels_playing = []
+        self.matches = MatchScheduler(bot.loop,
+                                      **bot.config.get('match_scheduler', {}))
+        self.question_banks = {}
+        self.leaderboard_cache = LeaderboardCache()
+        self.reactions = ReactionDispatcher()
+        self.typed_answers = MessageDispatcher()
+        self.username_sync = UsernameSync()
         self.answer_key = {
             '🇦': 0,
             '🇧': 1,
             '🇨': 2
         }
 
-    # Starts a game of trivia using the simpsons trivia questions
+    # Starts a game of trivia using the simpsons trivia questions, answered
+    # by typing in chat when the typed mode is given
     @commands.command(aliases=['strivia', 'simpsontrivia'])
     @commands.cooldown(10, 300, BucketType.channel)
-    async def simpsonstrivia(self, ctx):
-        if ctx.channel.id not in self.channels_playing:
-            await self.start_trivia(ctx, SimpsonsTrivia())
+    async def simpsonstrivia(self, ctx, mode: str = None):
+        if ctx.channel.id not in self.matches:
+            await self.start_trivia(ctx, SimpsonsTrivia(),
+                                    self.is_typed_mode(mode))
 
-    # Starts a game of trivia using the futurama trivia questions
+    # Starts a game of trivia using the futurama trivia questions, answered
+    # by typing in chat when the typed mode is given
     @commands.command(aliases=['ftrivia'])
     @commands.cooldown(10, 300, BucketType.channel)
-    async def futuramatrivia(self, ctx):
-        if ctx.channel.id not in self.channels_playing:
+    async def futuramatrivia(self, ctx, mode: str = None):
+        if ctx.channel.id not in self.matches:
             # Start the game
-            await self.start_trivia(ctx, FuturamaTrivia())
+            await self.start_trivia(ctx, FuturamaTrivia(),
+                                    self.is_typed_mode(mode))
+
+    @staticmethod
+    def is_typed_mode(mode):
+        return mode is not None and mode.lower() in TYPED_MODES
 
     # TODO: Starts a game of trivia using rick and morty trivia questions
     @commands.command(aliases=['ramtrivia'])
@@ -47,7 +75,7 @@ class Trivia(commands.Cog):
     @commands.command()
     @commands.cooldown(1, 3, BucketType.channel)
     async def stop(self, ctx):
-        if ctx.channel.id in self.channels_playing:
+        if self.matches.is_playing(ctx.channel.id):
             await ctx.send(
                 'The game of trivia will end once nobody answers a' +
                 ' question or a member with manage server ' +
@@ -57,198 +85,237 @@ class Trivia(commands.Cog):
     @commands.command()
     @commands.has_permissions(manage_guild=True)
     async def forcestop(self, ctx):
-        if ctx.channel.id in self.channels_playing:
-            self.channels_playing.remove(ctx.channel.id)
+        if self.matches.stop(ctx.channel.id):
             await ctx.send('Trivia has ended')
 
-    # Starts a match of trivia (multiple rounds of questions)
-    async def start_trivia(self, ctx, category):
-        self.channels_playing.append(ctx.channel.id)
+    # Stop the round timers and finish any deferred username syncs
+    def cog_unload(self):
+        self.matches.close()
+        self.bot.loop.create_task(self.username_sync.flush())
+
+    # Pass answers to the round of the question they were added to
+    @commands.Cog.listener()
+    async def on_reaction_add(self, reaction, user):
+        if not user.bot:
+            self.reactions.dispatch(reaction, user)
+
+    # Pass messages to the round being played in their channel, if it's
+    # answered by typing
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        if not message.author.bot:
+            self.typed_answers.dispatch(message)
+
+    # Get the question bank of a trivia category, loading the trivia file in
+    # a worker thread the first time the category is played
+    async def get_question_bank(self, category):
+        bank = self.question_banks.get(category.file_name)
+        if bank is None:
+            bank = await self.bot.loop.run_in_executor(
+                None, QuestionBank.from_file, 'cogs/data/' + category.file_name)
+            self.question_banks[category.file_name] = bank
+
+        return bank
+
+    # Starts a match of trivia (multiple rounds of questions), waiting for a
+    # free slot first when too many matches are being played
+    async def start_trivia(self, ctx, category, typed=False):
+        try:
+            match = self.matches.add(ctx.channel.id)
+        except MatchRejected:
+            await ctx.send('Trivia is busy right now, try again in a few '
+                           'minutes.')
+            return
+
+        try:
+            if not match.admitted:
+                await ctx.send('Trivia is busy right now, the game will start '
+                               'once another game ends.')
+                await self.matches.wait(match)
+
+                # Stopped with forcestop while waiting
+                if not match.playing:
+                    return
 
-        # Load question data from trivia file
-        with open('cogs/data/' + category.file_name, 'r') as trivia_data:
-            trivia = json.load(trivia_data)
-            questions = trivia.copy()
-            random.shuffle(questions)
-            trivia_data.close()
+            await self.play_match(ctx, match, category, typed)
+
+        except MatchRejected:
+            await ctx.send('Trivia is still busy, try again in a few minutes.')
+
+        finally:
+            self.matches.finish(match)
+
+    async def play_match(self, ctx, match, category, typed):
+        # Draw the questions for the match in a random order
+        bank = await self.get_question_bank(category)
+        question_ids = bank.shuffled_ids()
 
         # Insert new trivia match into DB
         query = '''INSERT INTO matches (guild_id, trivia_category) 
                    VALUES ($1, $2) RETURNING match_id
                 '''
-        match_id = await self.bot.db.fetchval(query, ctx.guild.id,
-                                              category.category_name)
+        with self.matches.timed():
+            match_id = await self.bot.db.fetchval(query, ctx.guild.id,
+                                                  category.category_name)
 
         # Continue playing trivia until exit or out of questions
-        while ctx.channel.id in self.channels_playing and len(questions) > 0:
-            question_data = questions.pop()
-            await self.play_round(ctx, match_id, question_data, trivia,
-                                  category)
-
-        await self.end_match(ctx, match_id, category)
+        summary = MatchSummary()
+        while match.playing and question_ids:
+            question = bank[question_ids.pop()]
+            await self.play_round(ctx, match_id, question, category, summary,
+                                  typed)
 
-    # Starts a round of trivia (single question)
-    async def play_round(self, ctx, match_id, question_data, trivia, category):
-        question_index = trivia.index(question_data)
-        question = question_data['question']
-        answers = question_data['answers']
-        source = question_data['source']
-        correct_answer = answers[0]
+        await self.end_match(ctx, match_id, category, summary)
 
-        # Shuffle the possible answers
-        random.shuffle(answers)
+    # Starts a round of trivia (single question), adding its answers to the
+    # match summary. Answers are reactions, or typed messages when typed
+    async def play_round(self, ctx, match_id, question, category, summary,
+                         typed=False):
+        question_index = question.question_id
 
-        correct_index = answers.index(correct_answer)
-        correct_choice = chr(correct_index + 65)
+        # Pick one of the question's precomputed answer orders, leaving the
+        # question bank untouched
+        layout = question.random_layout()
+        correct_index = layout.correct_index
 
         # Insert new trivia round into DB
         query = '''INSERT INTO rounds (match_id, question_index) VALUES ($1, $2)
                    RETURNING round_id
                 '''
-        round_id = await self.bot.db.fetchval(query, match_id, question_index)
+        with self.matches.timed():
+            round_id = await self.bot.db.fetchval(query, match_id,
+                                                  question_index)
 
         # Display the question and answers
-        answer_msg = (f'**A:** {answers[0]} \n**B:** {answers[1]} \n**C:** '
-                      f'{answers[2]} \n\nReact below to answer!')
+        answer_msg = layout.answer_lines + (TYPED_PROMPT if typed else
+                                            REACTION_PROMPT)
 
-        embed = discord.Embed(title=question, colour=category.colour,
+        embed = discord.Embed(title=question.question, colour=category.colour,
                               description=answer_msg)
         embed.set_thumbnail(url=category.thumbnail_url)
 
         # Send the trivia question
-        question = await ctx.send(embed=embed,
-                                  delete_after=self.TIMER_DURATION + 3)
+        question_msg = await ctx.send(embed=embed,
+                                      delete_after=self.TIMER_DURATION + 3)
+
+        # Start timer, answers are timed from when the question was sent
+        start_time = time.monotonic()
+        end_time = start_time + self.TIMER_DURATION
+
+        # Keep the answers in memory until the round is over
+        collector = AnswerCollector(round_id)
+
+        # Record a valid answer (A, B or C) to the question, only accepting
+        # each users first answer
+        def record_answer(user, answer_index, received_at):
+            if answer_index is None or received_at > end_time:
+                return
+
+            # Check if correct answer
+            is_correct = answer_index == correct_index
+            answer_time = int((received_at - start_time) * 1000)
+            collector.record(user, is_correct, answer_index, answer_time)
 
-        # Add the answer react boxes
-        await question.add_reaction('🇦')
-        await question.add_reaction('🇧')
-        await question.add_reaction('🇨')
+        def on_reaction(reaction, user, received_at):
+            record_answer(user, self.answer_key.get(str(reaction.emoji)),
+                          received_at)
 
-        # Check for confirming a valid answer was made (A, B or C)
-        def is_answer(reaction, user):
-            return (not user.bot and str(reaction.emoji) in ['🇦', '🇧', '🇨'] and
-                    reaction.message.guild == ctx.guild)
+        # Typed answers need no reactions, so the round starts as soon as the
+        # question is sent
+        if typed:
+            matcher = layout.get_matcher()
 
-        # Track some important round data
-        user_answers = {}
-        correct_count = 0
+            def on_message(message, received_at):
+                record_answer(message.author, matcher.match(message.content),
+                              received_at)
 
-        # Start timer
-        end_time = time.time() + self.TIMER_DURATION
+            self.typed_answers.register(ctx.channel.id, on_message)
 
+        else:
+            self.reactions.register(question_msg.id, on_reaction)
+
+            # Add the answer react boxes while answers are already being
+            # accepted
+            add_reactions = asyncio.gather(
+                *[question_msg.add_reaction(emoji)
+                  for emoji in self.answer_key],
+                return_exceptions=True)
+
+        # Wait until timer ends for each question before displaying results
         try:
-            # Wait until timer ends for each question before displaying results
-            while time.time() < end_time:
-                react, user = await self.bot.wait_for(
-                    'reaction_add', check=is_answer,
-                    timeout=end_time - time.time())
-
-                # Only accept users first answer
-                if user.id not in user_answers:
-                    answer_index = trivia[question_index]['answers'].\
-                        index(answers[self.answer_key[str(react.emoji)]])
-
-                    # Check if correct answer
-                    is_correct = answer_index == correct_index
-                    if is_correct:
-                        correct_count += 1
-                    answer_time = int((time.time() -
-                                       (end_time - self.TIMER_DURATION)) * 1000)
-
-                    # Insert answer into DB
-                    query = '''INSERT INTO answers (round_id, user_id, username,
-                               is_correct, answer_index, answer_time) 
-                               VALUES ($1, $2, $3, $4, $5, $6)
-                            '''
-                    await self.bot.db.fetch(query, round_id, int(user.id),
-                                            str(user), is_correct, answer_index,
-                                            answer_time)
-
-                    user_answers.update({user.id: {'answer': str(react.emoji)}})
-
-        except asyncio.TimeoutError:
-            pass
-
-        # Update usernames in the leaderboard
-        await self.update_usernames(ctx, round_id)
+            await self.matches.sleep_until(end_time)
+
+        finally:
+            if typed:
+                self.typed_answers.unregister(ctx.channel.id)
+            else:
+                self.reactions.unregister(question_msg.id)
+                await add_reactions
+
+        # Insert all the answers into DB
+        with self.matches.timed():
+            await collector.save(self.bot.db)
+        summary.add_round(collector)
 
         # Set round as complete (Triggers leaderboard stat updates)
         query = '''UPDATE rounds SET is_complete = true
                    WHERE round_id = $1
                 '''
-        await self.bot.db.fetch(query, round_id)
+        with self.matches.timed():
+            await self.bot.db.fetch(query, round_id)
+
+        # Update usernames in the leaderboard while the results are sent
+        self.username_sync.defer(self.bot.db, collector.usernames())
 
         # Check the results of the trivia question
         embed.set_thumbnail(url='')
-        embed.description = (f'**{correct_choice}:** {correct_answer}\n'
-                             f'**Source:** <{source}> \n\n')
+        embed.description = layout.result_lines
 
         # Give statement about result based on # of correct answers recorded
-        if len(user_answers) == 0:
+        correct_count = collector.correct_count
+        if len(collector) == 0:
             embed.description += '⛔ **No answers given! Trivia has ended.**'
-            if ctx.channel.id in self.channels_playing:
-                self.channels_playing.remove(ctx.channel.id)
+            self.matches.stop(ctx.channel.id)
 
-        elif len(user_answers) > 0 and correct_count == 0:
+        elif len(collector) > 0 and correct_count == 0:
             embed.description += '**No correct answers!**'
 
-        elif len(user_answers) == 1 and correct_count == 1:
+        elif len(collector) == 1 and correct_count == 1:
             embed.description += '**Correct!**'
 
         else:
             embed.description += f'**{str(correct_count)} correct answers!**'
-            for key in user_answers:
-                if user_answers[key]['answer'] == correct_choice:
-                    embed.description += '\n' + key.name
+            for name in collector.correct_names:
+                embed.description += '\n' + name
 
         await ctx.send(embed=embed, delete_after=self.TIMER_DURATION + 3)
 
-    # Update usernames in leaderboard
-    async def update_usernames(self, ctx, round_id):
-        # Get answers from the round
-        query = 'SELECT * FROM answers WHERE round_id = $1'
-        answers = await self.bot.db.fetch(query, round_id)
-
-        # For each answer in round, update username
-        for answer in answers:
-            # Add points to score
-            query = '''UPDATE leaderboard SET username = $1 
-                       WHERE user_id = $2
-                    '''
-            username = str(ctx.guild.get_member(answer['user_id']))
-            await self.bot.db.fetch(query, username, answer['user_id'])
-
-    async def end_match(self, ctx, match_id, category):
+    # Complete the match and display its scoreboard, built from the answers
+    # collected during the match or read from the DB if none were collected
+    async def end_match(self, ctx, match_id, category, summary=None):
         # Set the match as complete (Triggers leaderboard stat updates)
         query = '''UPDATE matches SET is_complete = true
                    WHERE match_id = $1
                 '''
         await self.bot.db.fetch(query, match_id)
+        self.leaderboard_cache.mark_stale()
 
-        # Top Scorers (sorted by correct answers descending)
-        query = '''SELECT user_id, COUNT(CASE WHEN is_correct THEN 1 END) 
-                   AS correct FROM answers a
-                   INNER JOIN rounds r
-                   ON a.round_id = r.round_id
-                   WHERE r.match_id = $1
-                   GROUP BY a.user_id
-                   ORDER BY correct DESC;
-                '''
-        top_scorers = await self.bot.db.fetch(query, match_id)
+        if summary is None:
+            summary = await MatchSummary.from_db(self.bot.db, match_id)
 
         # Check if there were anyone competing in the match
-        if len(top_scorers) == 0:
+        if len(summary) == 0:
             return
 
+        # Top Scorers (sorted by correct answers descending)
+        top_scorers = summary.top_scorers()
         scorers = ''
-        top_scorer = top_scorers[0]["user_id"]
-        for scorer in top_scorers[:5]:
-            scorers += (f'**{ctx.guild.get_member(scorer["user_id"]).name}**: '
-                        f'{str(scorer["correct"])}\n')
+        for scorer in top_scorers:
+            scorers += f'**{scorer.name}**: {str(scorer.correct)}\n'
 
         # Scoreboard display embed
         embed = discord.Embed(description='**Congratulations to the top scorer,'
-                              f' {ctx.guild.get_member(top_scorer).name} '
+                              f' {top_scorers[0].name} '
                               ':trophy:**', color=category.colour)
 
         embed.set_author(name='Trivia Scoreboard',
@@ -258,39 +325,19 @@ class Trivia(commands.Cog):
         embed.add_field(name='*:medal:Correct Answers*', value=scorers)
 
         # Highest Accuracy (sorted by accuracy descending)
-        query = '''SELECT user_id, 
-                   CAST(COUNT(CASE WHEN is_correct THEN 1 END) AS FLOAT) / 
-                   CAST(COUNT(user_id) AS FLOAT) AS accuracy FROM answers a 
-                   INNER JOIN rounds r 
-                   ON a.round_id = r.round_id 
-                   WHERE r.match_id = $1 
-                   GROUP BY a.user_id 
-                   ORDER BY accuracy DESC
-                '''
-        highest_accuracy = await self.bot.db.fetch(query, match_id)
-
         scorers = ''
-        for scorer in highest_accuracy[:5]:
-            scorers += (f'**{ctx.guild.get_member(scorer["user_id"]).name}**: '
-                        f'{str(scorer["accuracy"] * 100.0)}%\n')
+        for scorer in summary.most_accurate():
+            scorers += (f'**{scorer.name}**: '
+                        f'{str(scorer.accuracy * 100.0)}%\n')
         embed.add_field(name='*:bow_and_arrow: Highest Accuracy*',
                         value=scorers)
 
         # Fastest Answers (sorted by fastest time ascending)
-        query = '''SELECT user_id, MIN(answer_time) AS fastest_time 
-                   FROM answers a 
-                   INNER JOIN rounds r 
-                   ON a.round_id = r.round_id 
-                   WHERE a.is_correct = true and r.match_id = $1
-                   GROUP BY a.user_id
-                   ORDER BY fastest_time ASC
-                '''
-        fastest_answers = await self.bot.db.fetch(query, match_id)
-
+        fastest_answers = summary.fastest_answers()
         scorers = '' if len(fastest_answers) > 0 else '---'
-        for scorer in fastest_answers[:5]:
-            scorers += (f'**{ctx.guild.get_member(scorer["user_id"]).name}**: '
-                        f'{str(scorer["fastest_time"]/1000)}s\n')
+        for scorer in fastest_answers:
+            scorers += (f'**{scorer.name}**: '
+                        f'{str(scorer.fastest_correct/1000)}s\n')
         embed.add_field(name='*:point_up: Fastest Answers*', value=scorers)
 
         # Display the scoreboard
@@ -299,24 +346,7 @@ class Trivia(commands.Cog):
     # Display the global trivia leaderboard
     @commands.command()
     async def leaderboard(self, ctx):
-        stats = [
-            {"query": "SELECT username, score AS result "
-                      "FROM leaderboard ORDER BY score DESC",
-             "category": ":trophy: High Scores"},
-            {"query": "SELECT username, wins AS result "
-                      "FROM leaderboard ORDER BY wins DESC",
-             "category": ":first_place: Wins"},
-            {"query": "SELECT username, correct_answers AS result "
-                      "FROM leaderboard ORDER BY correct_answers DESC",
-             "category": ":white_check_mark:  Correct Answers"},
-            {"query": "SELECT username, CONCAT(CAST(fastest_answer AS FLOAT) "
-                      "/ 1000, 's') AS result "
-                      "FROM leaderboard ORDER BY fastest_answer ASC",
-             "category": ":point_up: Fastest Answers"},
-            {"query": "SELECT username, longest_streak AS result "
-                      "FROM leaderboard ORDER BY longest_streak DESC",
-             "category": ":chart_with_upwards_trend: Longest Streak"}
-        ]
+        fields = await self.leaderboard_cache.get_fields(self.bot.db)
 
         # Scoreboard display embed TODO: Add colour to discord.Embed()
         embed = discord.Embed()
@@ -326,21 +356,11 @@ class Trivia(commands.Cog):
                                   'AW/MitchellAW.github.io/master/images/flan' +
                                   'ders-square.png')
 
-        query = 'SELECT COUNT(user_id) FROM leaderboard'
-        leader_count = await self.bot.db.fetchval(query)
-
-        if leader_count >= 1:
-            for stat in stats:
-                rows = await self.bot.db.fetch(stat['query'])
-
-                scores = ''
-                for row in rows[:5]:
-                    scores += (f'**{row["username"]}**: '
-                               f'{str(row["result"])}\n')
-                embed.add_field(name=stat['category'], value=scores)
+        for category, scores in fields:
+            embed.add_field(name=category, value=scores)
 
-            if len(embed.fields) > 0:
-                await ctx.send(embed=embed)
+        if len(embed.fields) > 0:
+            await ctx.send(embed=embed)
 
 
 def setup(bot):
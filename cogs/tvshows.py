@@ -3,12 +3,40 @@ from discord.ext import commands
 
 import compuglobal
 
+from cache import LRUCache
+from cache import SingleFlight
+from cogs.screencap_pool import ScreencapPool
+
+# Cached in place of a screencap for searches without any results
+NO_RESULTS = object()
+
+
+# Normalise a search so that searches differing only by case or spacing
+# share a cache entry
+def normalise_search(search):
+    return ' '.join(search.lower().split())
+
 
 class TVShowCog(commands.Cog):
     def __init__(self, bot, api):
         self.bot = bot
         self.api = api
 
+        # Keep random screencaps with generated gifs ready to post
+        self.screencap_pool = ScreencapPool(
+            bot.loop, api, **bot.config.get('screencap_pool', {}))
+        self.screencap_pool.refill()
+
+        # Cache search results, misses are cached for a shorter time
+        search_config = bot.config.get('search_cache', {})
+        self.search_cache = LRUCache(search_config.get('max_size', 1000),
+                                     search_config.get('ttl', 86400))
+        self.no_results_ttl = search_config.get('no_results_ttl', 3600)
+        self.searches = SingleFlight()
+
+    def cog_unload(self):
+        self.screencap_pool.close()
+
     # Get random or searched screencap based on search parameter and update
     # cached_screencaps
     async def get_screencap(self, ctx, search=None):
@@ -18,11 +46,9 @@ class TVShowCog(commands.Cog):
                 screencap = await self.api.get_random_screencap()
 
             else:
-                screencap = await self.api.search_for_screencap(search)
+                screencap = await self.search_for_screencap(search)
 
-            self.bot.cached_screencaps.update(
-                {ctx.message.channel.id: screencap}
-            )
+            self.bot.cached_screencaps.set(ctx.message.channel.id, screencap)
 
         except compuglobal.APIPageStatusError as error:
             await self.bot.LOGGING.send(error)
@@ -33,6 +59,32 @@ class TVShowCog(commands.Cog):
 
         return screencap
 
+    # Search for a screencap, using cached results where possible and sharing
+    # a single API request between identical searches made at the same time
+    async def search_for_screencap(self, search):
+        search = normalise_search(search)
+        screencap = self.search_cache.get(search)
+        if screencap is None:
+            screencap = await self.searches.run(
+                search, lambda: self.fetch_search(search))
+
+        if screencap is NO_RESULTS:
+            raise compuglobal.NoSearchResultsFound()
+
+        return screencap
+
+    # Search the API for a screencap and cache the result
+    async def fetch_search(self, search):
+        try:
+            screencap = await self.api.search_for_screencap(search)
+
+        except compuglobal.NoSearchResultsFound:
+            self.search_cache.set(search, NO_RESULTS, ttl=self.no_results_ttl)
+            return NO_RESULTS
+
+        self.search_cache.set(search, screencap)
+        return screencap
+
     # Post a random screencap image with caption
     async def post_image(self, ctx, search=None, caption=None):
         screencap = await self.get_screencap(ctx, search)
@@ -43,6 +95,16 @@ class TVShowCog(commands.Cog):
     # Post a gif, if generating, post generating loading message and then edit
     # message to include gif with the generated url
     async def post_gif(self, ctx, search=None, caption=None, generate=True):
+        # Post a random gif that has already been generated if there is one
+        if search is None and caption is None and generate:
+            pooled = self.screencap_pool.take()
+            if pooled is not None:
+                screencap, generated_url = pooled
+                self.bot.cached_screencaps.set(ctx.message.channel.id,
+                                               screencap)
+                await ctx.send(generated_url)
+                return
+
         screencap = await self.get_screencap(ctx, search)
 
         if screencap is not None:
@@ -51,7 +113,8 @@ class TVShowCog(commands.Cog):
             if generate:
                 sent = await ctx.send('Generating {}... '.format(screencap.key)
                                       + '<a:loading:410316176510418955>')
-                generated_url = await self.api.generate_gif(gif_url)
+                generated_url = await self.bot.gif_cache.generate(self.api,
+                                                                  gif_url)
                 try:
                     await sent.edit(content=generated_url)
 
@@ -0,0 +1,59 @@
+import asyncio
+import asyncpg
+
+from cache import LRUCache
+
+
+# Keeps leaderboard usernames up to date with the names players answer with.
+# Names already written are remembered, so only names that changed since
+# are written, all of a round's changed names in one statement
+class UsernameSync:
+    def __init__(self, max_size=10000):
+        self.usernames = LRUCache(max_size)
+        self.tasks = set()
+
+        self.updated = 0
+        self.skipped = 0
+
+    # Write any changed names of (user_id, username) pairs to the leaderboard
+    async def sync(self, db, users):
+        changed = {}
+        for user_id, username in users:
+            if self.usernames.get(user_id) == username:
+                self.skipped += 1
+            else:
+                changed[user_id] = username
+
+        if len(changed) == 0:
+            return
+
+        query = '''UPDATE leaderboard l SET username = u.username
+                   FROM unnest($1::bigint[], $2::text[]) AS u(user_id, username)
+                   WHERE l.user_id = u.user_id
+                   AND l.username IS DISTINCT FROM u.username
+                '''
+        await db.execute(query, list(changed.keys()), list(changed.values()))
+
+        for user_id, username in changed.items():
+            self.usernames.set(user_id, username)
+        self.updated += len(changed)
+
+    # Sync the names in the background, e.g. once a round's results are sent
+    def defer(self, db, users):
+        task = asyncio.ensure_future(self.sync_quietly(db, list(users)))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    # Names are synced again the next time the player answers
+    async def sync_quietly(self, db, users):
+        try:
+            await self.sync(db, users)
+
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError,
+                asyncpg.InterfaceError) as e:
+            print('Failed to update usernames: {}'.format(e))
+
+    # Wait for any deferred syncs to finish
+    async def flush(self):
+        if self.tasks:
+            await asyncio.gather(*self.tasks)
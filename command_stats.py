@@ -0,0 +1,163 @@
+import json
+import os
+import time
+
+import asyncio
+
+
+# Counts commands used in memory and writes them to command_stats.json in the
+# background, either every flush_interval seconds or once flush_threshold
+# commands have been counted since the last write. When clustered, each
+# process counts and writes its own commands and publishes them after every
+# write, so totals include the counts of every process in the cluster
+class CommandStats:
+    def __init__(self, loop, file_path='cogs/data/command_stats.json',
+                 flush_interval=60, flush_threshold=100, broker=None):
+        self.loop = loop
+        self.file_path = file_path
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.broker = broker
+        self.counts = self.read(file_path)
+
+        # Latest published counts of the other processes, by cluster id
+        self.remote_counts = {}
+        if broker is not None:
+            broker.subscribe('command_stats', self.on_remote_counts)
+            broker.on_resync(self.publish)
+
+        # Commands counted since the last successful write
+        self.pending = 0
+        self.flush_count = 0
+        self.last_flush_latency = None
+        self.max_flush_latency = 0.0
+
+        self.flush_lock = asyncio.Lock()
+        self.threshold_reached = asyncio.Event()
+        self.flush_task = None
+
+    # Start flushing the command statistics in the background, letting the
+    # rest of the cluster know the counts this process starts with
+    def start(self):
+        if self.flush_task is None:
+            self.flush_task = self.loop.create_task(self.flush_periodically())
+            if self.broker is not None:
+                self.loop.create_task(self.publish())
+
+    # Send this process's counts to the rest of the cluster
+    async def publish(self):
+        await self.broker.publish('command_stats', dict(self.counts))
+
+    # Count a single use of the command
+    def increment(self, command):
+        self.counts[command] = self.counts.get(command, 0) + 1
+        self.pending += 1
+
+        if self.pending >= self.flush_threshold:
+            self.threshold_reached.set()
+
+    # Store the counts published by another process
+    def on_remote_counts(self, origin, counts):
+        self.remote_counts[origin] = counts
+
+    # Counts of every command used across the cluster
+    def cluster_counts(self):
+        counts = dict(self.counts)
+        for remote_counts in self.remote_counts.values():
+            for command, count in remote_counts.items():
+                counts[command] = counts.get(command, 0) + count
+
+        return counts
+
+    # Total number of commands used across the cluster
+    def total(self):
+        return sum(self.counts.values()) + sum(
+            sum(counts.values()) for counts in self.remote_counts.values())
+
+    # Flush every interval, or earlier if the dirty count threshold is reached
+    async def flush_periodically(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.threshold_reached.wait(),
+                                       timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self.threshold_reached.clear()
+            try:
+                await self.flush()
+
+            except asyncio.CancelledError:
+                raise
+
+            # Keep the counts pending and try again next interval, whatever
+            # went wrong writing them
+            except Exception as error:
+                print('Failed to write command stats: {!r}'.format(error))
+
+    # Write a snapshot of the counts to file in a worker thread
+    async def flush(self):
+        async with self.flush_lock:
+            if self.pending == 0:
+                return
+
+            snapshot = dict(self.counts)
+            flushed = self.pending
+            self.pending = 0
+
+            start = time.perf_counter()
+            try:
+                await self.loop.run_in_executor(None, self.write,
+                                                self.file_path, snapshot)
+
+            except Exception:
+                self.pending += flushed
+                raise
+
+            self.last_flush_latency = time.perf_counter() - start
+            self.max_flush_latency = max(self.max_flush_latency,
+                                         self.last_flush_latency)
+            self.flush_count += 1
+
+        if self.broker is not None:
+            await self.broker.publish('command_stats', snapshot)
+
+    # Stop flushing in the background and write any remaining counts
+    async def close(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+
+        await self.flush()
+
+    # Flush latency and pending delta metrics
+    def metrics(self):
+        return {
+            'pending': self.pending,
+            'flush_count': self.flush_count,
+            'last_flush_latency': self.last_flush_latency,
+            'max_flush_latency': self.max_flush_latency
+        }
+
+    # Read the command statistics from json file, a process joining the
+    # cluster for the first time starts with no counts
+    @staticmethod
+    def read(file_path):
+        try:
+            with open(file_path, 'r') as command_counter:
+                return json.load(command_counter)
+
+        except FileNotFoundError:
+            return {}
+
+    # Dump the command statistics to a temporary file and rename it over the
+    # json file, so a crash mid-write never leaves a truncated file behind
+    @staticmethod
+    def write(file_path, command_stats):
+        temp_path = file_path + '.tmp'
+        with open(temp_path, 'w') as command_counter:
+            json.dump(command_stats, command_counter, indent=4)
+            command_counter.flush()
+            os.fsync(command_counter.fileno())
+
+        os.replace(temp_path, file_path)
@@ -0,0 +1,94 @@
+import hashlib
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import LRUCache
+from cache import SingleFlight
+
+
+# Caches generated gif urls by the gif url they were generated from, which
+# encodes the show, episode, timestamps and caption of the gif. Entries are
+# kept in a SQLite file so they survive restarts, with the most recently used
+# also kept in memory. Concurrent requests for the same gif share one render
+class GifCache:
+    def __init__(self, loop, file_path='cogs/data/gif_cache.db',
+                 max_size=10000):
+        self.loop = loop
+        self.memory = LRUCache(max_size)
+        self.renders = SingleFlight()
+
+        # All SQLite access happens on a single worker thread
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.connection = sqlite3.connect(file_path, check_same_thread=False)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS gifs (
+                                   gif_hash text PRIMARY KEY,
+                                   generated_url text NOT NULL,
+                                   created_at real NOT NULL)''')
+        self.connection.commit()
+
+        self.disk_hits = 0
+        self.generated = 0
+
+    # Get the generated url for the gif, generating it with the api only if
+    # it has never been generated before
+    async def generate(self, api, gif_url):
+        generated_url = self.memory.get(gif_url)
+        if generated_url is not None:
+            return generated_url
+
+        return await self.renders.run(
+            gif_url, lambda: self.load_or_generate(api, gif_url))
+
+    async def load_or_generate(self, api, gif_url):
+        gif_hash = self.hash(gif_url)
+        generated_url = await self.loop.run_in_executor(
+            self.executor, self.read, gif_hash)
+
+        if generated_url is not None:
+            self.disk_hits += 1
+
+        else:
+            generated_url = str(await api.generate_gif(gif_url))
+            self.generated += 1
+
+            # The api gives back the original url if generating timed out
+            if generated_url == gif_url:
+                return generated_url
+
+            await self.loop.run_in_executor(self.executor, self.write,
+                                            gif_hash, generated_url)
+
+        self.memory.set(gif_url, generated_url)
+        return generated_url
+
+    def read(self, gif_hash):
+        row = self.connection.execute(
+            'SELECT generated_url FROM gifs WHERE gif_hash = ?',
+            (gif_hash,)).fetchone()
+        return row[0] if row is not None else None
+
+    def write(self, gif_hash, generated_url):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO gifs VALUES (?, ?, ?)',
+            (gif_hash, generated_url, time.time()))
+        self.connection.commit()
+
+    # Close the SQLite file once all writes have finished
+    async def close(self):
+        await self.loop.run_in_executor(self.executor, self.connection.close)
+        self.executor.shutdown()
+
+    # Memory, disk and render counters
+    def metrics(self):
+        stats = self.memory.metrics()
+        stats.update({
+            'disk_hits': self.disk_hits,
+            'generated': self.generated,
+            'coalesced': self.renders.coalesced
+        })
+        return stats
+
+    @staticmethod
+    def hash(gif_url):
+        return hashlib.sha256(gif_url.encode('utf-8')).hexdigest()
@@ -0,0 +1,132 @@
+import argparse
+import json
+import sys
+
+import aiohttp
+import asyncio
+
+GATEWAY_URL = 'https://discordapp.com/api/v7/gateway/bot'
+
+
+# Get the number of shards Discord recommends for the bot
+async def get_recommended_shard_count(token):
+    headers = {'Authorization': 'Bot ' + token}
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_URL, headers=headers) as response:
+            response.raise_for_status()
+            gateway = await response.json()
+
+    return gateway['shards']
+
+
+# Split the shards into one contiguous range per process, e.g. 10 shards
+# across 3 processes gives 0-3, 4-6 and 7-9
+def split_shards(shard_count, processes):
+    shard_ranges = []
+    first = 0
+    for cluster_id in range(processes):
+        size = shard_count // processes
+        if cluster_id < shard_count % processes:
+            size += 1
+
+        shard_ranges.append((first, first + size - 1))
+        first += size
+
+    return shard_ranges
+
+
+# Runs one bot.py process per cluster, restarting a process whenever it
+# exits with an error. A process that exits cleanly was shut down on purpose
+# and isn't restarted
+class ClusterLauncher:
+    def __init__(self, shard_count, processes, restart_delay=5,
+                 max_restart_delay=300, command=None):
+        self.shard_count = shard_count
+        self.shard_ranges = split_shards(shard_count, processes)
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.command = command or [sys.executable, 'bot.py']
+        self.processes = {}
+        self.restarts = 0
+
+    def worker_command(self, cluster_id):
+        first, last = self.shard_ranges[cluster_id]
+        return self.command + [
+            '--shard-count', str(self.shard_count),
+            '--shards', '{}-{}'.format(first, last),
+            '--cluster-id', str(cluster_id)
+        ]
+
+    # Run every process until all of them have shut down cleanly
+    async def run(self):
+        await asyncio.gather(*[self.supervise(cluster_id) for cluster_id
+                               in range(len(self.shard_ranges))])
+
+    # Keep a process running, waiting longer between each failed start
+    async def supervise(self, cluster_id):
+        loop = asyncio.get_event_loop()
+        delay = self.restart_delay
+        while True:
+            process = await asyncio.create_subprocess_exec(
+                *self.worker_command(cluster_id))
+            self.processes[cluster_id] = process
+            print('Cluster {} started (shards {}-{}, pid {})'.format(
+                cluster_id, *self.shard_ranges[cluster_id], process.pid))
+
+            started = loop.time()
+            return_code = await process.wait()
+            if return_code == 0:
+                print('Cluster {} shut down'.format(cluster_id))
+                return
+
+            # Reset the backoff once a process has stayed up for a while
+            if loop.time() - started > self.max_restart_delay:
+                delay = self.restart_delay
+
+            print('Cluster {} exited with code {}, restarting in {}s'.format(
+                cluster_id, return_code, delay))
+            self.restarts += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_restart_delay)
+
+    # Stop every running process
+    def terminate(self):
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.terminate()
+
+
+async def main(args):
+    with open('settings/config.json', 'r') as conf:
+        config = json.load(conf)
+
+    cluster = config.get('cluster', {})
+    processes = args.processes or cluster.get('processes', 1)
+    shard_count = args.shard_count or cluster.get('shard_count')
+    if shard_count is None:
+        shard_count = await get_recommended_shard_count(config['bot_token'])
+
+    launcher = ClusterLauncher(
+        shard_count, min(processes, shard_count),
+        restart_delay=cluster.get('restart_delay', 5),
+        max_restart_delay=cluster.get('max_restart_delay', 300))
+    try:
+        await launcher.run()
+
+    finally:
+        launcher.terminate()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Run FlandersBOT across multiple processes')
+    parser.add_argument('--processes', type=int,
+                        help='number of processes to split the shards across')
+    parser.add_argument('--shard-count', type=int,
+                        help='total number of shards, recommended by default')
+
+    try:
+        asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
+
+    except KeyboardInterrupt:
+        pass
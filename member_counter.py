@@ -0,0 +1,166 @@
+import time
+
+import asyncio
+import discord
+
+
+# Member, bot and online counts of a single guild
+class GuildCounts:
+    __slots__ = ('members', 'bots', 'online')
+
+    def __init__(self, members=0, bots=0, online=0):
+        self.members = members
+        self.bots = bots
+        self.online = online
+
+    # Count the members of the guild, a chunk of members at a time so large
+    # guilds don't block the loop
+    @classmethod
+    async def count(cls, guild, chunk_size=10000):
+        counts = cls()
+        for index, member in enumerate(guild.members, 1):
+            counts.add(member, 1)
+            if index % chunk_size == 0:
+                await asyncio.sleep(0)
+
+        return counts
+
+    # Add (or remove when sign is -1) a member to the counts
+    def add(self, member, sign):
+        self.members += sign
+        if member.bot:
+            self.bots += sign
+
+        if member.status == discord.Status.online:
+            self.online += sign
+
+
+# Keeps member, bot and online counts for every guild up to date from member
+# and guild events, so stats never has to look at every member. Counts are
+# recounted every reconcile_interval seconds, correcting any drift from
+# members that were loaded without an event
+class MemberCounter:
+    def __init__(self, bot, reconcile_interval=600):
+        self.bot = bot
+        self.reconcile_interval = reconcile_interval
+        self.guilds = {}
+        self.totals = GuildCounts()
+        self.task = None
+
+        self.reconciles = 0
+        self.drift = 0
+        self.last_reconcile_duration = None
+
+    def __getitem__(self, guild_id):
+        return self.guilds[guild_id]
+
+    def __contains__(self, guild_id):
+        return guild_id in self.guilds
+
+    def start(self):
+        for listener in (self.on_member_join, self.on_member_remove,
+                         self.on_member_update, self.on_guild_join,
+                         self.on_guild_remove):
+            self.bot.add_listener(listener)
+
+        if self.task is None:
+            self.task = self.bot.loop.create_task(self.reconcile_periodically())
+
+    async def on_member_join(self, member):
+        self.update(member.guild.id, member, 1)
+
+    async def on_member_remove(self, member):
+        self.update(member.guild.id, member, -1)
+
+    # Only a change to or from online changes the counts
+    async def on_member_update(self, before, after):
+        was_online = before.status == discord.Status.online
+        is_online = after.status == discord.Status.online
+        counts = self.guilds.get(after.guild.id)
+        if counts is None or was_online == is_online:
+            return
+
+        sign = 1 if is_online else -1
+        counts.online += sign
+        self.totals.online += sign
+
+    async def on_guild_join(self, guild):
+        await self.recount(guild)
+
+    async def on_guild_remove(self, guild):
+        self.set(guild.id, None)
+
+    def update(self, guild_id, member, sign):
+        counts = self.guilds.get(guild_id)
+        if counts is not None:
+            counts.add(member, sign)
+            self.totals.add(member, sign)
+
+    # Replace the counts of a guild, None removes the guild
+    def set(self, guild_id, counts):
+        old = self.guilds.pop(guild_id, None)
+        if old is not None:
+            self.totals.members -= old.members
+            self.totals.bots -= old.bots
+            self.totals.online -= old.online
+
+        if counts is not None:
+            self.guilds[guild_id] = counts
+            self.totals.members += counts.members
+            self.totals.bots += counts.bots
+            self.totals.online += counts.online
+
+    # Count the members of a guild from scratch, returns how far the counts
+    # had drifted
+    async def recount(self, guild):
+        counts = await GuildCounts.count(guild)
+        old = self.guilds.get(guild.id)
+        self.set(guild.id, counts)
+        if old is None:
+            return 0
+
+        return (abs(old.members - counts.members) +
+                abs(old.online - counts.online))
+
+    # Recount every guild once ready and every interval after that
+    async def reconcile_periodically(self):
+        await self.bot.wait_until_ready()
+        while not self.bot.is_closed():
+            await self.reconcile()
+            await asyncio.sleep(self.reconcile_interval)
+
+    async def reconcile(self):
+        start = time.perf_counter()
+        guilds = self.bot.guilds
+        drift = 0
+        scanned = 0
+        for guild in guilds:
+            drift += await self.recount(guild)
+
+            # Hand the loop back between chunks of small guilds too
+            scanned += len(guild.members)
+            if scanned >= 10000:
+                scanned = 0
+                await asyncio.sleep(0)
+
+        # Drop guilds that were removed without an event
+        guild_ids = set(guild.id for guild in guilds)
+        for guild_id in list(self.guilds):
+            if guild_id not in guild_ids:
+                self.set(guild_id, None)
+
+        self.drift = drift
+        self.reconciles += 1
+        self.last_reconcile_duration = time.perf_counter() - start
+
+    # Total counts and how far they drifted before the last recount
+    def metrics(self):
+        return {
+            'guilds': len(self.guilds),
+            'members': self.totals.members,
+            'bots': self.totals.bots,
+            'online': self.totals.online,
+            'reconciles': self.reconciles,
+            'drift': self.drift,
+            'last_reconcile_duration': self.last_reconcile_duration
+        }
@@ -0,0 +1,220 @@
+-- Scores trivia answers once per round with score_round instead of once per
+-- inserted answer with the update_stats trigger.
+-- Stop the bot before migrating, answers of unfinished rounds have already
+-- been scored by update_stats and would be scored again.
+-- psql -h 127.0.0.1 -d flandersdb -U ned -f migrations/001_set_based_scoring.sql
+BEGIN;
+
+-- Every question a user has answered correctly at least once, used for
+-- finding unique answers without scanning the answers table
+CREATE TABLE IF NOT EXISTS correct_answers (
+	user_id bigint NOT NULL,
+	question_index int NOT NULL,
+	PRIMARY KEY (user_id, question_index)
+);
+
+-- Find the answers of a round and the rounds of a match without a
+-- sequential scan
+CREATE INDEX IF NOT EXISTS answers_round_id_idx ON answers (round_id);
+CREATE INDEX IF NOT EXISTS rounds_match_id_idx ON rounds (match_id);
+
+-- Find the recent votes of the users being scored
+CREATE INDEX IF NOT EXISTS vote_history_user_id_voted_at_idx
+ON vote_history (user_id, voted_at);
+
+-- Applies a vote xp multiplier to points gained, rounds to nearest 5
+CREATE OR REPLACE FUNCTION multiply_points(multiplier float, points bigint)
+RETURNS bigint AS $$
+	SELECT CAST(5 * ROUND(multiplier * points / 5) AS bigint);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Update the statistics of every user that answered in a round, in a single
+-- pass over the round's answers. Users can only answer once per round.
+-- Correct: 100 points, 10 bonus points for each correct answer in a row and
+-- 500 bonus points the first time the user answers the question correctly
+-- Incorrect: 5 points and reset the streak
+-- Round bonus: 50 points for the fastest correct answer and 50 points for
+-- being the only correct answer
+CREATE OR REPLACE FUNCTION score_round(p_round_id int) RETURNS void AS $$
+	BEGIN
+		-- Insert users that answered into leaderboard
+		INSERT INTO leaderboard (user_id, username)
+		SELECT DISTINCT ON (user_id) user_id, username
+		FROM answers WHERE round_id = p_round_id
+		ON CONFLICT DO NOTHING;
+
+		WITH round_answers AS (
+			SELECT a.user_id, a.is_correct, a.answer_time, r.question_index
+			FROM answers a
+			INNER JOIN rounds r
+			ON a.round_id = r.round_id
+			WHERE a.round_id = p_round_id
+		),
+		-- Users that answered and have the vote multiplier today
+		voters AS (
+			SELECT DISTINCT v.user_id FROM vote_history v
+			WHERE v.user_id IN (SELECT user_id FROM round_answers)
+			AND v.voted_at BETWEEN (
+				NOW() AT time zone 'utc') - INTERVAL '24 HOURS' AND (
+				NOW() AT time zone 'utc')
+		),
+		-- Correct answers to a question the user never answered correctly
+		unique_answers AS (
+			INSERT INTO correct_answers (user_id, question_index)
+			SELECT user_id, question_index FROM round_answers
+			WHERE is_correct
+			ON CONFLICT DO NOTHING
+			RETURNING user_id
+		),
+		fastest_answer AS (
+			SELECT user_id FROM round_answers
+			WHERE is_correct
+			ORDER BY answer_time ASC
+			LIMIT 1
+		),
+		correct_count AS (
+			SELECT COUNT(*) AS total FROM round_answers WHERE is_correct
+		),
+		deltas AS (
+			SELECT ra.user_id, ra.is_correct, ra.answer_time,
+				(CASE WHEN vo.user_id IS NULL THEN 1 ELSE 1.5 END) AS multiplier,
+				ua.user_id IS NOT NULL AS is_unique,
+				fa.user_id IS NOT NULL AS is_fastest,
+				ra.is_correct AND cc.total = 1 AS is_only
+			FROM round_answers ra
+			CROSS JOIN correct_count cc
+			LEFT JOIN voters vo ON ra.user_id = vo.user_id
+			LEFT JOIN unique_answers ua ON ra.user_id = ua.user_id
+			LEFT JOIN fastest_answer fa ON ra.user_id = fa.user_id
+		)
+		UPDATE leaderboard l SET
+			score = l.score
+				+ multiply_points(d.multiplier, CASE WHEN d.is_correct
+					THEN 100 + (10 * l.current_streak) ELSE 5 END)
+				+ (CASE WHEN d.is_unique THEN multiply_points(d.multiplier, 500) ELSE 0 END)
+				+ (CASE WHEN d.is_fastest THEN multiply_points(d.multiplier, 50) ELSE 0 END)
+				+ (CASE WHEN d.is_only THEN multiply_points(d.multiplier, 50) ELSE 0 END),
+			correct_answers = l.correct_answers + (CASE WHEN d.is_correct THEN 1 ELSE 0 END),
+			incorrect_answers = l.incorrect_answers + (CASE WHEN d.is_correct THEN 0 ELSE 1 END),
+			fastest_answer = (CASE WHEN d.is_correct
+				THEN LEAST(l.fastest_answer, d.answer_time) ELSE l.fastest_answer END),
+			current_streak = (CASE WHEN d.is_correct THEN l.current_streak + 1 ELSE 0 END),
+			longest_streak = (CASE WHEN d.is_correct
+				THEN GREATEST(l.longest_streak, l.current_streak + 1) ELSE l.longest_streak END)
+		FROM deltas d
+		WHERE l.user_id = d.user_id;
+	END;
+$$ LANGUAGE plpgsql;
+
+-- Update the statistics of every player in a match, in a single pass over the
+-- match's answers. Requires that 5 rounds were played, with more than one
+-- player. Winner is determined based on correct answers, then fastest answer
+-- 1,000 bonus points and +1 win for the winner, 100 bonus points and +1 loss
+-- for every other player, 100 bonus points for the fastest correct answer
+CREATE OR REPLACE FUNCTION score_match(p_match_id int) RETURNS void AS $$
+	DECLARE
+		round_count int := (SELECT COUNT(*) FROM rounds
+						    WHERE match_id = p_match_id);
+	BEGIN
+		IF round_count < 5 THEN
+			RETURN;
+		END IF;
+
+		WITH players AS (
+			SELECT a.user_id,
+				COUNT(CASE WHEN a.is_correct THEN 1 END) AS correct,
+				MIN(a.answer_time) AS fastest_time,
+				MIN(CASE WHEN a.is_correct THEN a.answer_time END) AS fastest_correct
+			FROM answers a
+			INNER JOIN rounds r
+			ON a.round_id = r.round_id
+			WHERE r.match_id = p_match_id
+			GROUP BY a.user_id
+		),
+		ranked AS (
+			SELECT user_id, COUNT(*) OVER () AS player_count,
+				ROW_NUMBER() OVER (ORDER BY correct DESC, fastest_time ASC) AS placing,
+				ROW_NUMBER() OVER (ORDER BY fastest_correct ASC NULLS LAST) AS speed,
+				fastest_correct
+			FROM players
+		),
+		voters AS (
+			SELECT DISTINCT v.user_id FROM vote_history v
+			WHERE v.user_id IN (SELECT user_id FROM players)
+			AND v.voted_at BETWEEN (
+				NOW() AT time zone 'utc') - INTERVAL '24 HOURS' AND (
+				NOW() AT time zone 'utc')
+		),
+		deltas AS (
+			SELECT rk.user_id, rk.placing = 1 AS is_winner,
+				rk.speed = 1 AND rk.fastest_correct IS NOT NULL AS is_fastest,
+				(CASE WHEN vo.user_id IS NULL THEN 1 ELSE 1.5 END) AS multiplier
+			FROM ranked rk
+			LEFT JOIN voters vo ON rk.user_id = vo.user_id
+			WHERE rk.player_count > 1
+		)
+		UPDATE leaderboard l SET
+			wins = l.wins + (CASE WHEN d.is_winner THEN 1 ELSE 0 END),
+			losses = l.losses + (CASE WHEN d.is_winner THEN 0 ELSE 1 END),
+			score = l.score
+				+ multiply_points(d.multiplier, CASE WHEN d.is_winner THEN 1000 ELSE 100 END)
+				+ (CASE WHEN d.is_fastest THEN multiply_points(d.multiplier, 100) ELSE 0 END)
+		FROM deltas d
+		WHERE l.user_id = d.user_id;
+	END;
+$$ LANGUAGE plpgsql;
+
+-- Update stats of all users that answered once the round is complete
+CREATE OR REPLACE FUNCTION end_round() RETURNS TRIGGER AS $BODY$
+	BEGIN
+		IF (new.is_complete AND NOT old.is_complete) THEN
+			PERFORM score_round(new.round_id);
+		END IF;
+		RETURN NEW;
+	END;
+$BODY$
+language plpgsql;
+
+-- Update stats of all players once the match is complete
+CREATE OR REPLACE FUNCTION end_match() RETURNS TRIGGER AS $BODY$
+	BEGIN
+		IF (new.is_complete AND NOT old.is_complete) THEN
+			PERFORM score_match(new.match_id);
+		END IF;
+		RETURN NEW;
+	END;
+$BODY$
+language plpgsql;
+
+-- Trigger stat updates on round end
+DROP TRIGGER IF EXISTS update_round ON rounds;
+CREATE TRIGGER update_round
+	BEFORE UPDATE ON rounds
+	FOR EACH ROW
+	EXECUTE FUNCTION end_round();
+
+-- Trigger stat updates on match end
+DROP TRIGGER IF EXISTS update_match ON matches;
+CREATE TRIGGER update_match
+	BEFORE UPDATE ON matches
+	FOR EACH ROW
+	EXECUTE FUNCTION end_match();
+
+-- Answers are now scored by the update_round trigger, and the per-row
+-- scoring functions are replaced by score_round and score_match
+DROP TRIGGER IF EXISTS insert_answer ON answers;
+DROP FUNCTION IF EXISTS update_stats();
+DROP FUNCTION IF EXISTS get_winner(bigint);
+DROP FUNCTION IF EXISTS get_fastest_answer(bigint);
+DROP FUNCTION IF EXISTS is_unique_answer(bigint, int);
+DROP FUNCTION IF EXISTS vote_multiply(bigint, bigint);
+
+-- Record the questions users have already answered correctly
+INSERT INTO correct_answers (user_id, question_index)
+SELECT DISTINCT a.user_id, r.question_index FROM answers a
+INNER JOIN rounds r
+ON a.round_id = r.round_id
+WHERE a.is_correct
+ON CONFLICT DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,17 @@
+-- Adds covering indexes for the top players of each leaderboard stat.
+-- psql -h 127.0.0.1 -d flandersdb -U ned -f migrations/002_leaderboard_indexes.sql
+BEGIN;
+
+-- Read the top players of each leaderboard stat straight from an index
+CREATE INDEX IF NOT EXISTS leaderboard_score_idx
+ON leaderboard (score DESC) INCLUDE (username);
+CREATE INDEX IF NOT EXISTS leaderboard_wins_idx
+ON leaderboard (wins DESC) INCLUDE (username);
+CREATE INDEX IF NOT EXISTS leaderboard_correct_answers_idx
+ON leaderboard (correct_answers DESC) INCLUDE (username);
+CREATE INDEX IF NOT EXISTS leaderboard_fastest_answer_idx
+ON leaderboard (fastest_answer ASC) INCLUDE (username);
+CREATE INDEX IF NOT EXISTS leaderboard_longest_streak_idx
+ON leaderboard (longest_streak DESC) INCLUDE (username);
+
+COMMIT;
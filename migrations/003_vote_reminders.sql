@@ -0,0 +1,13 @@
+-- Adds the vote_reminders table, vote reminder subscriptions now persist
+-- across restarts.
+-- psql -h 127.0.0.1 -d flandersdb -U ned -f migrations/003_vote_reminders.sql
+BEGIN;
+
+-- Users subscribed to vote reminders and when their next reminder is due,
+-- remind_at is null when no reminder is pending
+CREATE TABLE IF NOT EXISTS vote_reminders (
+	user_id bigint PRIMARY KEY,
+	remind_at timestamp
+);
+
+COMMIT;
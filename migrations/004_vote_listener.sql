@@ -0,0 +1,10 @@
+-- Adds an index on vote_history.voted_at, used by the vote listener to find
+-- the votes added since it last caught up.
+-- psql -h 127.0.0.1 -d flandersdb -U ned -f migrations/004_vote_listener.sql
+BEGIN;
+
+-- Find the votes added since the vote listener last caught up
+CREATE INDEX IF NOT EXISTS vote_history_voted_at_idx
+ON vote_history (voted_at);
+
+COMMIT;
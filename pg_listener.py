@@ -0,0 +1,114 @@
+import traceback
+
+import asyncio
+import asyncpg
+
+# Errors that mean a listener connection or a query through the pool failed
+CONNECTION_ERRORS = (OSError, asyncio.TimeoutError, asyncpg.PostgresError,
+                     asyncpg.InterfaceError)
+
+
+# Keeps a connection listening on a Postgres channel open, reconnecting with
+# exponential backoff whenever it's lost or stops responding to the health
+# check run every health_interval seconds. Notifications are passed to
+# on_notify(connection, pid, channel, payload), on_connect() is awaited each
+# time it connects and on_health_check() after each health check passes
+class PostgresListener:
+    def __init__(self, name, db_credentials, channel, on_notify,
+                 on_connect=None, on_health_check=None, reconnect_delay=1,
+                 max_reconnect_delay=60, health_interval=60, query_timeout=10):
+        self.name = name
+        self.db_credentials = db_credentials
+        self.channel = channel
+        self.on_notify = on_notify
+        self.on_connect = on_connect
+        self.on_health_check = on_health_check
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.health_interval = health_interval
+        self.query_timeout = query_timeout
+        self.connection = None
+        self.connected = asyncio.Event()
+        self.terminated = asyncio.Event()
+
+        # Queries share the connection, which runs one query at a time
+        self.query_lock = asyncio.Lock()
+        self.task = None
+
+        self.reconnects = 0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+
+    def is_connected(self):
+        return self.connection is not None and not self.connection.is_closed()
+
+    # Keep the connection open, reconnecting with exponential backoff
+    async def run(self):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                await self.listen()
+
+            except CONNECTION_ERRORS as e:
+                print('{} disconnected: {!r}'.format(self.name, e))
+
+            # Anything else is a bug, keep listening for what comes after it
+            except Exception:
+                print('{} failed:'.format(self.name))
+                traceback.print_exc()
+
+            # Back off from the first delay again if it managed to connect
+            if self.connection is not None:
+                delay = self.reconnect_delay
+
+            await self.disconnect()
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    # Listen until the connection is lost or stops responding
+    async def listen(self):
+        self.terminated.clear()
+        self.connection = await asyncpg.connect(**self.db_credentials)
+        self.connection.add_termination_listener(
+            lambda connection: self.terminated.set())
+        await self.connection.add_listener(self.channel, self.on_notify)
+        self.connected.set()
+
+        if self.on_connect is not None:
+            await self.on_connect()
+
+        while not self.terminated.is_set():
+            try:
+                await asyncio.wait_for(self.terminated.wait(),
+                                       timeout=self.health_interval)
+            # Check the connection still responds
+            except asyncio.TimeoutError:
+                await asyncio.wait_for(self.execute('SELECT 1;'),
+                                       timeout=self.query_timeout)
+                if self.on_health_check is not None:
+                    await self.on_health_check()
+
+    # Run a query on the listener connection
+    async def execute(self, query, *args):
+        async with self.query_lock:
+            if self.connection is None:
+                raise ConnectionError('{} is not connected'.format(self.name))
+
+            await self.connection.execute(query, *args)
+
+    async def disconnect(self):
+        self.connected.clear()
+        if self.connection is not None:
+            self.connection.terminate()
+            self.connection = None
+
+    # Stop listening and close the connection
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+        await self.disconnect()
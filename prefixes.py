@@ -1,4 +1,10 @@
 import json
+import os
+
+# Prefixes every guild can use, custom guild prefixes are appended to these
+DEFAULT_PREFIXES = (
+    'ned ', 'Ned ', 'NED ', 'diddly-', 'doodly-', 'diddly ', 'doodly '
+)
 
 
 def read_prefixes():
@@ -11,35 +17,52 @@ def read_prefixes():
 
 # Writes the prefix to prefixes.json
 def write_prefixes(prefix_data):
-    # Write the new prefix to the file
-    with open('cogs/data/prefixes.json', 'w') as prefix_list:
+    # Write the new prefixes to a temporary file and rename it over the old
+    # file, so processes in a cluster never read a partially written file
+    temp_path = 'cogs/data/prefixes.json.{}.tmp'.format(os.getpid())
+    with open(temp_path, 'w') as prefix_list:
         json.dump(prefix_data, prefix_list, indent=4)
-        prefix_list.close()
 
+    os.replace(temp_path, 'cogs/data/prefixes.json')
+
+
+# Keeps every guild's prefixes keyed by guild ID, so resolving the prefixes
+# for a message is a single dict lookup instead of a scan of prefixes.json
+class PrefixRegistry:
+    def __init__(self, prefix_data):
+        self.custom_prefixes = {}
+        self.guild_prefixes = {}
+
+        for entry in prefix_data:
+            self.update(entry['guildID'], entry['prefix'])
+
+    def __len__(self):
+        return len(self.custom_prefixes)
+
+    # Get all the prefixes the guild can use
+    def prefixes_for(self, guild):
+        if guild is None:
+            return DEFAULT_PREFIXES
 
-# Find the index of the guild in prefixes.json
-def find_guild(guild, prefix_data):
-    if guild is None:
-        return -1
+        return self.guild_prefixes.get(guild.id, DEFAULT_PREFIXES)
 
-    for i in range(len(prefix_data)):
-        if prefix_data[i]['guildID'] == guild.id:
-            return i
+    # Get the custom prefix of the guild, None if it doesn't have one
+    def custom_prefix(self, guild):
+        if guild is None:
+            return None
 
-    return -1
+        return self.custom_prefixes.get(guild.id)
 
+    # Set the custom prefix of a guild, rebuilding only that guild's prefixes
+    def update(self, guild_id, prefix):
+        self.custom_prefixes[guild_id] = prefix
+        self.guild_prefixes[guild_id] = DEFAULT_PREFIXES + (prefix,)
 
-# Get all the prefixes the guild can use
-def prefixes_for(guild, prefix_data):
-    guild_index = find_guild(guild, prefix_data)
-    if guild_index == -1:
-        return [
-            'ned ', 'Ned ', 'NED ', 'diddly-', 'doodly-', 'diddly ', 'doodly '
-        ]
+    # Convert back to the list format stored in prefixes.json
+    def to_list(self):
+        return [{'guildID': guild_id, 'prefix': prefix}
+                for guild_id, prefix in self.custom_prefixes.items()]
 
-    else:
-        custom_prefix = prefix_data[guild_index]['prefix']
-        return [
-            'ned ', 'Ned ', 'NED ', 'diddly-', 'doodly-', 'diddly ', 'doodly ',
-            custom_prefix
-        ]
+    # Write all custom prefixes to prefixes.json
+    def save(self):
+        write_prefixes(self.to_list())
@@ -0,0 +1,76 @@
+import time
+
+import asyncio
+import discord
+
+
+# Cycles the bot's status through bot.status_formats and keeps the guild
+# count of the whole cluster in it up to date. Guild count changes and status
+# cycles share one schedule, so presence is changed at most once every
+# `window` seconds and never changed to the status it already has
+class PresenceScheduler:
+    def __init__(self, bot, window=15, cycle_interval=60):
+        self.bot = bot
+        self.window = window
+        self.cycle_interval = cycle_interval
+        self.status_index = 0
+        self.status = None
+        self.last_update = None
+        self.update_requested = asyncio.Event()
+        self.task = None
+
+        self.updates = 0
+        self.skipped = 0
+
+    def start(self):
+        if self.task is None:
+            self.task = self.bot.loop.create_task(self.run())
+
+    # Update the presence within the next window, e.g. guild count changed
+    def request_update(self):
+        self.update_requested.set()
+
+    # Change presence when an update is requested or the status cycles,
+    # waiting out the rest of the window after the last change
+    async def run(self):
+        await self.bot.wait_until_ready()
+        next_cycle = time.monotonic()
+        while not self.bot.is_closed():
+            try:
+                await asyncio.wait_for(
+                    self.update_requested.wait(),
+                    timeout=max(0, next_cycle - time.monotonic()))
+
+            # Cycle to the next status format
+            except asyncio.TimeoutError:
+                if self.status is not None:
+                    self.status_index += 1
+                next_cycle = time.monotonic() + self.cycle_interval
+
+            if self.last_update is not None:
+                remaining = self.last_update + self.window - time.monotonic()
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+
+            # Requests made while waiting are covered by this update
+            self.update_requested.clear()
+            try:
+                await self.update()
+
+            # Shard is reconnecting, the next update will catch up
+            except discord.ConnectionClosed:
+                pass
+
+    # Change presence to the current status format with the guild count
+    async def update(self):
+        formats = self.bot.status_formats
+        self.status_index %= len(formats)
+        status = formats[self.status_index].format(self.bot.guild_count())
+        if status == self.status:
+            self.skipped += 1
+            return
+
+        await self.bot.change_presence(activity=discord.Game(name=status))
+        self.status = status
+        self.last_update = time.monotonic()
+        self.updates += 1
@@ -0,0 +1,67 @@
+import sys
+
+from compuglobal.aio_screencap import AIOScreencap
+
+from cache import LRUCache
+
+
+# The parts of a screencap that epinfo and meme use, without the json
+# response, frame and other urls a full compuglobal screencap keeps around
+class CachedScreencap:
+    __slots__ = ('api', 'key', 'timestamp', 'title', 'air_date', 'wiki_url',
+                 'director', 'writer', 'real_timestamp', 'caption', 'gif_url')
+
+    def __init__(self, screencap):
+        self.api = screencap.api
+        self.key = screencap.key
+        self.timestamp = screencap.timestamp
+        self.title = screencap.title
+        self.air_date = screencap.air_date
+        self.wiki_url = screencap.wiki_url
+        self.director = screencap.director
+        self.writer = screencap.writer
+        self.real_timestamp = screencap.get_real_timestamp()
+        self.caption = screencap.caption
+        self.gif_url = screencap.gif_url
+
+    def get_real_timestamp(self):
+        return self.real_timestamp
+
+    # Get the gif url for the screencap with the caption embedded, using
+    # compuglobal's own screencap code, which only needs the parts kept here
+    async def get_gif_url(self, caption=None, before=3000, after=4000):
+        return await AIOScreencap.get_gif_url(self, caption, before, after)
+
+    # Approximate size in bytes, not counting the shared api
+    def size(self):
+        return sys.getsizeof(self) + sum(
+            sys.getsizeof(getattr(self, slot)) for slot in self.__slots__
+            if slot != 'api')
+
+
+# Keeps the last screencap posted in each channel, for epinfo and meme.
+# Bounded to max_size channels, evicting the least recently used channel,
+# and channels that haven't used a screencap for idle_ttl seconds expire
+class ScreencapStore:
+    def __init__(self, max_size=10000, idle_ttl=3600):
+        self.screencaps = LRUCache(max_size, idle_ttl, refresh_on_get=True)
+
+    def __len__(self):
+        return len(self.screencaps)
+
+    # Get the last screencap posted in the channel, None if there isn't one
+    def get(self, channel_id):
+        return self.screencaps.get(channel_id)
+
+    # Store the screencap as the last posted in the channel
+    def set(self, channel_id, screencap):
+        self.screencaps.set(channel_id, CachedScreencap(screencap))
+
+    # Entry counts, evictions and approximate memory usage
+    def memory_stats(self):
+        self.screencaps.remove_expired()
+        stats = self.screencaps.metrics()
+        stats['bytes'] = (sys.getsizeof(self.screencaps.entries) +
+                          sum(entry[0].size() for entry in
+                              self.screencaps.entries.values()))
+        return stats
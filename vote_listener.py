@@ -0,0 +1,125 @@
+from datetime import datetime
+from datetime import timedelta
+import traceback
+
+import asyncio
+
+from pg_listener import CONNECTION_ERRORS
+from pg_listener import PostgresListener
+from vote_reminders import VOTE_INTERVAL
+
+
+# Listens for the vote notifications sent when a vote is added to
+# vote_history, reconnecting with backoff whenever the connection is lost.
+# Notifications only wake the listener, votes are read from vote_history
+# through the pool starting from the last voted_at handled, so votes added
+# while disconnected are still handled once reconnected. Votes from the
+# overlap seconds before that are read again, so votes that committed late
+# with an earlier voted_at aren't skipped, and vote ids already handled are
+# skipped instead
+class VoteListener:
+    def __init__(self, bot, on_vote, reconnect_delay=1, max_reconnect_delay=60,
+                 health_interval=60, overlap=60):
+        self.bot = bot
+        self.on_vote = on_vote
+        self.overlap = timedelta(seconds=overlap)
+
+        # Votes missed while disconnected are handled once connected, and any
+        # vote added without a notification after each health check
+        self.listener = PostgresListener(
+            'Vote listener', bot.config['db_credentials'], 'vote',
+            self.on_notification, on_connect=self.catch_up,
+            on_health_check=self.catch_up, reconnect_delay=reconnect_delay,
+            max_reconnect_delay=max_reconnect_delay,
+            health_interval=health_interval)
+        self.catch_up_lock = asyncio.Lock()
+
+        # Votes older than this have already been handled, votes from before
+        # startup still need a reminder but weren't notified to this process
+        self.started_at = datetime.utcnow()
+        self.watermark = self.started_at - VOTE_INTERVAL
+
+        # Reminders for votes older than this were already sent before the
+        # restart, so the overlap never reaches back past it
+        self.earliest = self.watermark
+
+        # Voted at times of the votes handled within the overlap, by vote id
+        self.handled = {}
+
+        self.notifications = 0
+        self.votes = 0
+        self.last_lag = None
+        self.max_lag = 0.0
+
+    def start(self):
+        self.listener.start()
+
+    # Stop listening and close the connection
+    async def close(self):
+        await self.listener.close()
+
+    def on_notification(self, connection, pid, channel, payload):
+        self.notifications += 1
+        self.bot.loop.create_task(self.catch_up())
+
+    # Handle every vote not handled yet from the overlap before the watermark
+    # on, in the order they were made
+    async def catch_up(self):
+        async with self.catch_up_lock:
+            try:
+                rows = await self.bot.db.fetch(
+                    '''SELECT vote_id, user_id, voted_at FROM vote_history
+                       WHERE voted_at >= $1 AND vote_type = 'upvote'
+                       ORDER BY voted_at, vote_id;''',
+                    max(self.watermark - self.overlap, self.earliest))
+
+            except CONNECTION_ERRORS as e:
+                print('Failed to read votes: {}'.format(e))
+                return
+
+            # Forget the votes that won't be read again
+            cutoff = self.watermark - self.overlap
+            self.handled = {vote_id: voted_at for vote_id, voted_at
+                            in self.handled.items() if voted_at >= cutoff}
+
+            for row in rows:
+                if row['vote_id'] in self.handled:
+                    continue
+
+                # Only thank users for votes made while the bot is running,
+                # a vote that fails is tried again on the next catch up
+                is_live = row['voted_at'] > self.started_at
+                try:
+                    await self.on_vote(row['user_id'], row['voted_at'],
+                                       is_live)
+
+                except CONNECTION_ERRORS as e:
+                    print('Failed to handle vote: {}'.format(e))
+                    return
+
+                # Trying again won't fix anything else, skip the vote
+                except Exception:
+                    print('Failed to handle vote {}:'.format(row['vote_id']))
+                    traceback.print_exc()
+
+                self.handled[row['vote_id']] = row['voted_at']
+                self.watermark = max(self.watermark, row['voted_at'])
+                self.votes += 1
+                if is_live:
+                    lag = (datetime.utcnow() -
+                           row['voted_at']).total_seconds()
+                    self.last_lag = lag
+                    self.max_lag = max(self.max_lag, lag)
+
+    # Notification, lag and reconnect counters, lag is the time from a vote
+    # being added to it being handled
+    def metrics(self):
+        return {
+            'connected': self.listener.is_connected(),
+            'notifications': self.notifications,
+            'votes': self.votes,
+            'reconnects': self.listener.reconnects,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag,
+            'watermark': self.watermark
+        }
@@ -0,0 +1,226 @@
+import heapq
+from datetime import datetime
+from datetime import timedelta
+
+import asyncio
+import asyncpg
+import discord
+
+VOTE_URL = '<https://discordbots.org/bot/221609683562135553/vote>'
+
+# Time a user has to wait between votes
+VOTE_INTERVAL = timedelta(hours=12)
+
+# Reminder times are naive utc datetimes, sent between processes as seconds
+# since this
+EPOCH = datetime(1970, 1, 1)
+
+
+# Get when the user can vote next, None if they can vote now
+async def get_next_vote(db, user_id):
+    voted_at = await db.fetchval(
+        '''SELECT voted_at FROM latest_votes
+           WHERE user_id = $1 AND vote_type = 'upvote';''', user_id)
+    if voted_at is None or voted_at + VOTE_INTERVAL <= datetime.utcnow():
+        return None
+
+    return voted_at + VOTE_INTERVAL
+
+
+# Keeps the users subscribed to vote reminders and sends each of them a DM
+# once they can vote again. Subscriptions and pending reminders are kept in
+# the vote_reminders table so they survive restarts, and pending reminders
+# are kept in a heap by due time so one task sends every reminder
+class VoteReminders:
+    def __init__(self, bot, broker):
+        self.bot = bot
+        self.broker = broker
+        self.subscribers = set()
+
+        # Heap of (remind_at, user_id), an entry is stale once the user's
+        # reminder is rescheduled or cancelled
+        self.heap = []
+        self.scheduled = {}
+        self.rescheduled = asyncio.Event()
+        self.task = None
+
+        self.sent = 0
+        self.failed = 0
+
+        broker.subscribe('reminder', self.on_remote_reminder)
+        broker.on_resync(self.reload)
+
+    def __contains__(self, user_id):
+        return user_id in self.subscribers
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    # Load subscriptions from the db, sending reminders too when this process
+    # is the one that tracks votes
+    async def start(self, send_reminders=True):
+        rows = await self.bot.db.fetch(
+            'SELECT user_id, remind_at FROM vote_reminders;')
+        for row in rows:
+            self.subscribers.add(row['user_id'])
+            if send_reminders and row['remind_at'] is not None:
+                self.push(row['user_id'], row['remind_at'])
+
+        # Reminders that came due while the bot was offline are sent first
+        if send_reminders and self.task is None:
+            self.task = self.bot.loop.create_task(self.run())
+
+    # Reload subscriptions from the db, as subscription events from other
+    # processes may have been lost
+    async def reload(self):
+        if self.bot.db is None:
+            return
+
+        try:
+            rows = await self.bot.db.fetch(
+                'SELECT user_id, remind_at FROM vote_reminders;')
+
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError,
+                asyncpg.InterfaceError) as e:
+            print('Failed to reload vote reminders: {}'.format(e))
+            return
+
+        self.subscribers = {row['user_id'] for row in rows}
+        for user_id in list(self.scheduled):
+            if user_id not in self.subscribers:
+                del self.scheduled[user_id]
+
+        if self.task is not None:
+            for row in rows:
+                remind_at = row['remind_at']
+                if (remind_at is not None and
+                        self.scheduled.get(row['user_id']) != remind_at):
+                    self.push(row['user_id'], remind_at)
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    # Subscribe a user to reminders, reminding them at remind_at if they
+    # can't vote yet
+    async def subscribe(self, user_id, remind_at=None):
+        await self.bot.db.execute(
+            '''INSERT INTO vote_reminders (user_id, remind_at) VALUES ($1, $2)
+               ON CONFLICT (user_id)
+               DO UPDATE SET remind_at = EXCLUDED.remind_at;''',
+            user_id, remind_at)
+        self.add(user_id, remind_at)
+        await self.publish(user_id, True, remind_at)
+
+    async def unsubscribe(self, user_id):
+        await self.bot.db.execute(
+            'DELETE FROM vote_reminders WHERE user_id = $1;', user_id)
+        self.remove(user_id)
+        await self.publish(user_id, False, None)
+
+    # Remind a subscribed user that voted at voted_at once they can vote
+    # again, unless they already can (the reminder was sent before a restart)
+    async def schedule(self, user_id, voted_at):
+        if user_id not in self.subscribers:
+            return
+
+        remind_at = voted_at + VOTE_INTERVAL
+        if remind_at <= datetime.utcnow():
+            return
+        await self.bot.db.execute(
+            'UPDATE vote_reminders SET remind_at = $2 WHERE user_id = $1;',
+            user_id, remind_at)
+        self.push(user_id, remind_at)
+
+    def add(self, user_id, remind_at):
+        self.subscribers.add(user_id)
+        if self.task is not None and remind_at is not None:
+            self.push(user_id, remind_at)
+
+    def remove(self, user_id):
+        self.subscribers.discard(user_id)
+        self.scheduled.pop(user_id, None)
+
+    # Add a reminder to the heap, waking the task if it's now due first
+    def push(self, user_id, remind_at):
+        self.scheduled[user_id] = remind_at
+        heapq.heappush(self.heap, (remind_at, user_id))
+        if self.heap[0] == (remind_at, user_id):
+            self.rescheduled.set()
+
+    # Let the other processes of the cluster know a subscription changed
+    async def publish(self, user_id, enabled, remind_at):
+        await self.broker.publish('reminder', {
+            'user_id': user_id,
+            'enabled': enabled,
+            'remind_at': ((remind_at - EPOCH).total_seconds()
+                          if remind_at else None)
+        })
+
+    def on_remote_reminder(self, origin, data):
+        if not data['enabled']:
+            self.remove(data['user_id'])
+            return
+
+        remind_at = data['remind_at']
+        if remind_at is not None:
+            remind_at = EPOCH + timedelta(seconds=remind_at)
+        self.add(data['user_id'], remind_at)
+
+    # Sleep until the next reminder is due, send every due reminder and
+    # repeat. Wakes early when a reminder is scheduled before the next one
+    async def run(self):
+        await self.bot.wait_until_ready()
+        while not self.bot.is_closed():
+            timeout = None
+            if self.heap:
+                timeout = max(0, (self.heap[0][0] -
+                                  datetime.utcnow()).total_seconds())
+
+            try:
+                await asyncio.wait_for(self.rescheduled.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+            self.rescheduled.clear()
+            now = datetime.utcnow()
+            while self.heap and self.heap[0][0] <= now:
+                remind_at, user_id = heapq.heappop(self.heap)
+                if self.scheduled.get(user_id) != remind_at:
+                    continue
+
+                del self.scheduled[user_id]
+                await self.send(user_id, remind_at)
+
+    # Let the user know they can vote again and clear the reminder in the db,
+    # unless it was rescheduled in the meantime
+    async def send(self, user_id, remind_at):
+        try:
+            user = self.bot.get_user(user_id)
+            if user is None:
+                user = await self.bot.fetch_user(user_id)
+            await user.send(VOTE_URL + '\n**You can vote now.**')
+            self.sent += 1
+
+        except discord.HTTPException:
+            self.failed += 1
+
+        # A failed update only means the reminder is sent again on restart
+        try:
+            await self.bot.db.execute(
+                '''UPDATE vote_reminders SET remind_at = NULL
+                   WHERE user_id = $1 AND remind_at = $2;''',
+                user_id, remind_at)
+
+        except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            print('Failed to clear vote reminder: {}'.format(e))
+
+    # Subscriber and reminder counters
+    def metrics(self):
+        return {
+            'subscribers': len(self.subscribers),
+            'pending': len(self.scheduled),
+            'sent': self.sent,
+            'failed': self.failed
+        }